@@ -0,0 +1,16 @@
+# app/backfill_rollups.py
+from .database import SessionLocal
+from .utils import rollup
+
+
+def main():
+    db = SessionLocal()
+    try:
+        rollup.backfill(db)
+        print("✓ Sales rollups rebuilt from orders")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
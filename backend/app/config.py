@@ -26,11 +26,60 @@ class Settings(BaseSettings):
     secret_key: str = "change-me"
     access_token_expire_minutes: int = 43200
 
+    # bcrypt: стоимость (log2 раундов) для новых хэшей и сколько хэшей считать
+    # параллельно — в отдельном пуле потоков, не на event loop
+    bcrypt_rounds: int = 12
+    password_hash_workers: int = 2
+    # кэш пользователей по токену: сколько токенов держать и сколько секунд верить
+    auth_cache_size: int = 1024
+    auth_cache_ttl: float = 300.0
+
     # cookie
     cookie_name: str = "access_token"
     cookie_secure: bool = False
     cookie_samesite: Literal["lax", "none", "strict"] = "lax"
 
+    # realtime: окно склейки мутаций перед пересборкой снимков каналов (мс)
+    broadcast_window_ms: int = 100
+    # очередь исходящих сообщений на одно ws-подключение и поведение при переполнении
+    ws_queue_size: int = 32
+    ws_send_timeout: float = 5.0
+    ws_slow_policy: Literal["drop_oldest", "disconnect"] = "drop_oldest"
+    # транспорт событий между воркерами/контейнерами: memory | postgres (LISTEN/NOTIFY)
+    pubsub_backend: Literal["memory", "postgres"] = "memory"
+    pubsub_channel: str = "qoyu_events"
+    # сколько держать статистику дашборда, если заказов не было (сек)
+    dashboard_cache_ttl: float = 30.0
+    # архив: закрытые заказы старше N дней уходят в *_archive раз в interval минут
+    order_archive_after_days: int = 2
+    order_archive_interval_minutes: int = 60
+    # меню (GET /products, /options/groups, /categories): хранить можно, но
+    # перед использованием сверять ETag — правки админа видны сразу
+    menu_cache_control: str = "public, no-cache"
+
+    # пул соединений с Postgres — на каждый движок (sync и async) в каждом воркере
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30.0
+    # пересоздавать соединения старше N секунд (-1 — никогда)
+    db_pool_recycle: int = 1800
+    # проверочный SELECT 1 при каждой выдаче из пула; без него обрывы ловит recycle
+    db_pool_pre_ping: bool = True
+    # PgBouncer в режиме transaction: asyncpg без prepared statements.
+    # LISTEN/NOTIFY (pubsub_backend=postgres) так не работает — нужен session-режим
+    db_pgbouncer: bool = False
+
+    # загрузка картинок: лимит размера, качество WebP-вариантов, потоки на сжатие
+    media_max_upload_mb: float = 10.0
+    media_webp_quality: int = 82
+    media_workers: int = 2
+    # /media: имена не переиспользуются, поэтому кэшируем навсегда
+    media_cache_control: str = "public, max-age=31536000, immutable"
+    # GC media_dir: раз в interval минут удалять файлы, на которые нет ссылок
+    # и которые старше grace минут (успевших загрузиться, но ещё не закоммиченных не трогаем)
+    media_gc_interval_minutes: int = 60
+    media_gc_grace_minutes: int = 60
+
     model_config = SettingsConfigDict(
         env_file=".env",
         env_prefix="",
@@ -1,8 +1,10 @@
 # app/create_db.py
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import Session
 from sqlalchemy.engine.url import make_url
 from .config import settings
 from .database import Base  # Берём Declarative Base
+from .utils import rollup
 from . import models  # Регистрируем все модели (обязательно, чтобы create_all увидел таблицы)
 
 
@@ -49,6 +51,43 @@ def _create_database_if_missing(url):
         raise last_err
 
 
+def _ensure_columns(engine):
+    # create_all не добавляет новые колонки в уже существующие таблицы;
+    # досоздаём только nullable-колонки без умолчаний — им не нужен перенос данных
+    existing = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            have = {c["name"] for c in existing.get_columns(table.name)}
+            for col in table.columns:
+                if col.name in have or not col.nullable or col.server_default is not None:
+                    continue
+                coltype = col.type.compile(dialect=engine.dialect)
+                conn.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN IF NOT EXISTS "{col.name}" {coltype}'))
+
+
+def _ensure_indexes(engine):
+    # create_all не добавляет новые индексы в уже существующие таблицы
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+
+def _backfill_daily_counters(engine):
+    """
+    Счётчики дневных номеров для дней, заказы которых появились до daily_counters
+    (иначе в день обновления номера начались бы заново с 1).
+    """
+    with engine.begin() as conn:
+        conn.execute(text("""
+            INSERT INTO daily_counters (day, last_seq)
+            SELECT date(timezone('Asia/Almaty', guest_date)), max(guest_seq)
+            FROM orders
+            GROUP BY 1
+            ON CONFLICT (day) DO UPDATE
+                SET last_seq = GREATEST(daily_counters.last_seq, EXCLUDED.last_seq)
+        """))
+
+
 def main():
     url = make_url(settings.DATABASE_URL)
 
@@ -63,6 +102,21 @@ def main():
     Base.metadata.create_all(bind=target_engine)
     print(f"✓ Tables created in '{url.database}'")
 
+    # 3) Колонки и индексы, объявленные в моделях после создания таблиц
+    _ensure_columns(target_engine)
+    _ensure_indexes(target_engine)
+    print("✓ Columns and indexes ensured")
+
+    # 4) Досоздаём счётчики дневных номеров по уже существующим заказам
+    _backfill_daily_counters(target_engine)
+    print("✓ Daily guest counters synced")
+
+    # 5) Агрегаты продаж — один раз, при первом запуске с rollup-таблицами
+    with Session(target_engine) as db:
+        if rollup.is_empty(db):
+            rollup.backfill(db)
+            print("✓ Sales rollups backfilled")
+
 
 if __name__ == "__main__":
     main()
@@ -1,8 +1,11 @@
 # app/database.py
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.engine.url import make_url
+from uuid import uuid4
 from .config import settings
+from .utils.dbpool import TimedAsyncQueuePool, TimedQueuePool
 
 if not settings.DATABASE_URL:
     raise RuntimeError("DATABASE_URL is not set")
@@ -21,13 +24,48 @@ if url.get_backend_name() != "postgresql":
 #   pip install psycopg[binary]
 # или
 #   pip install psycopg2-binary
+_pool = dict(
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
+    pool_timeout=settings.db_pool_timeout,
+    pool_recycle=settings.db_pool_recycle,
+    pool_pre_ping=settings.db_pool_pre_ping,
+)
+
 engine = create_engine(
     url.render_as_string(hide_password=False),
-    pool_pre_ping=True,
+    poolclass=TimedQueuePool,
+    **_pool,
 )
 
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
 
+# async-движок для хэндлеров на event loop (заказы, дашборд, снимки каналов):
+# запрос к БД не блокирует loop, а с ним и websocket-подключения воркера.
+# Тот же URL, драйвер asyncpg.
+async_url = url.set(drivername="postgresql+asyncpg")
+
+_async_connect_args = {}
+if settings.db_pgbouncer:
+    # PgBouncer отдаёт каждой транзакции любое серверное соединение:
+    # кэш prepared statements выключаем, а имена делаем уникальными
+    _async_connect_args = {
+        "statement_cache_size": 0,
+        "prepared_statement_cache_size": 0,
+        "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__",
+    }
+
+async_engine = create_async_engine(
+    async_url.render_as_string(hide_password=False),
+    poolclass=TimedAsyncQueuePool,
+    connect_args=_async_connect_args,
+    **_pool,
+)
+
+# expire_on_commit=False: после commit атрибуты не перечитываются лениво
+# (ленивая загрузка в async-сессии недоступна)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
 class Base(DeclarativeBase):
     pass
 
@@ -37,3 +75,7 @@ def get_db():
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
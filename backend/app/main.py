@@ -1,18 +1,43 @@
 # app/main.py
+import asyncio
 import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 
 from .config import settings
-from .database import Base, engine
+from .database import Base, engine, async_engine
+from .utils.broadcast import hub
+from .utils.refresh import refresher
+from .utils.archive import archive_forever
+from .utils.media_gc import collect_forever
+from .utils.media_static import MediaFiles
 from .routers import auth, categories, products, options, dashboard, orders
 
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    # pubsub-транспорт событий (LISTEN/NOTIFY при нескольких воркерах)
+    await refresher.start()
+    # фоновый перенос старых закрытых заказов в архив
+    archiver = asyncio.create_task(archive_forever())
+    # сборка мусора в media_dir: файлы, на которые больше нет ссылок
+    media_gc = asyncio.create_task(collect_forever())
+    try:
+        yield
+    finally:
+        archiver.cancel()
+        media_gc.cancel()
+        await refresher.stop()
+        await async_engine.dispose()
+
+
 app = FastAPI(
     title=settings.app_name,
     debug=settings.debug,
     docs_url="/docs",
     redoc_url="/redoc",
+    lifespan=lifespan,
 )
 
 Base.metadata.create_all(bind=engine)
@@ -29,7 +54,7 @@ app.add_middleware(
 )
 
 os.makedirs(settings.media_dir, exist_ok=True)
-app.mount("/media", StaticFiles(directory=settings.media_dir), name="media")
+app.mount("/media", MediaFiles(directory=settings.media_dir), name="media")
 
 app.include_router(auth.router)
 app.include_router(categories.router)
@@ -42,6 +67,16 @@ app.include_router(orders.router)
 def health():
     return {"ok": True, "app": settings.app_name}
 
+@app.get("/health/ws")
+def health_ws():
+    # очереди, потери и задержки отправки по каналам websocket
+    return hub.metrics()
+
+@app.get("/health/db")
+def health_db():
+    # пулы соединений: занятые, overflow, ожидание выдачи и таймауты
+    return {"sync": engine.pool.metrics(), "async": async_engine.pool.metrics()}
+
 @app.get("/")
 def root():
     return {"message": f"{settings.app_name}. See /docs for API."}
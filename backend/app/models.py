@@ -1,10 +1,12 @@
 from sqlalchemy import (
-    Column, Integer, String, Text, Numeric, Boolean, Enum, ForeignKey, DateTime,
-    func, UniqueConstraint, Table
+    Column, Integer, SmallInteger, String, Text, Numeric, Boolean, Enum, ForeignKey, DateTime, Date,
+    func, UniqueConstraint, Table, Index
 )
 from sqlalchemy.orm import relationship, Mapped, mapped_column
+from sqlalchemy.dialects.postgresql import JSONB
 from .database import Base
 import enum
+from datetime import date
 
 class Role(str, enum.Enum):
     admin = "admin"
@@ -31,6 +33,8 @@ class Product(Base):
     base_price: Mapped[float] = mapped_column(Numeric(12,2))
     description: Mapped[str | None] = mapped_column(Text, nullable=True)
     image_filename: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    # WebP-варианты картинки: {"thumb": ..., "medium": ..., "full": ...}
+    image_variants: Mapped[dict | None] = mapped_column(JSONB, nullable=True)
     category_id: Mapped[int] = mapped_column(ForeignKey("categories.id", ondelete="SET NULL"), nullable=True)
     created_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now())
 
@@ -58,6 +62,8 @@ class OptionItem(Base):
     name: Mapped[str] = mapped_column(String(120))
     price: Mapped[float] = mapped_column(Numeric(12,2), default=0)
     image_filename: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    # WebP-варианты картинки: {"thumb": ..., "medium": ..., "full": ...}
+    image_variants: Mapped[dict | None] = mapped_column(JSONB, nullable=True)
 
     group = relationship("OptionGroup", back_populates="items")
 
@@ -75,6 +81,13 @@ class OrderStatus(str, enum.Enum):
 
 class Order(Base):
     __tablename__ = "orders"
+    __table_args__ = (
+        # очередь/дашборд: статус + время, диапазонные фильтры по [start, end)
+        Index("ix_orders_status_created_at", "status", "created_at"),
+        Index("ix_orders_status_closed_at", "status", "closed_at"),
+        # поиск заказа по дневному номеру за сегодня
+        Index("ix_orders_guest_date_guest_seq", "guest_date", "guest_seq"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     customer_name: Mapped[str] = mapped_column(String(255))
@@ -90,6 +103,12 @@ class Order(Base):
 
     items = relationship("OrderItem", cascade="all, delete-orphan", back_populates="order")
 
+class DailyCounter(Base):
+    """Последний выданный guest_seq за локальный (Asia/Almaty) день."""
+    __tablename__ = "daily_counters"
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    last_seq: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
 class OrderItem(Base):
     __tablename__ = "order_items"
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
@@ -113,3 +132,64 @@ class OrderItemOption(Base):
 
     item = relationship("OrderItem", back_populates="options")
     option_item = relationship("OptionItem")
+
+# ---- Orders archive ----
+# Закрытые заказы старше ORDER_ARCHIVE_AFTER_DAYS переносятся сюда
+# (utils/archive), чтобы «горячие» таблицы оставались маленькими.
+# id сохраняются как в исходных таблицах.
+class OrderArchive(Base):
+    __tablename__ = "orders_archive"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    customer_name: Mapped[str] = mapped_column(String(255))
+    take_away: Mapped[bool] = mapped_column(Boolean, default=False)
+    total: Mapped[float] = mapped_column(Numeric(12,2))
+    created_at: Mapped[str] = mapped_column(DateTime(timezone=True), index=True)
+    closed_at: Mapped[str | None] = mapped_column(DateTime(timezone=True), nullable=True, index=True)
+    guest_seq: Mapped[int] = mapped_column(Integer, nullable=False)
+    guest_date: Mapped[str] = mapped_column(DateTime(timezone=True))
+
+    items = relationship("OrderItemArchive", cascade="all, delete-orphan", back_populates="order")
+
+class OrderItemArchive(Base):
+    __tablename__ = "order_items_archive"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    order_id: Mapped[int] = mapped_column(ForeignKey("orders_archive.id", ondelete="CASCADE"), index=True)
+    product_id: Mapped[int] = mapped_column(ForeignKey("products.id", ondelete="SET NULL"), nullable=True)
+    name_snapshot: Mapped[str] = mapped_column(String(255))
+    unit_price: Mapped[float] = mapped_column(Numeric(12,2))
+    qty: Mapped[int] = mapped_column(Integer)
+
+    order = relationship("OrderArchive", back_populates="items")
+    options = relationship("OrderItemOptionArchive", cascade="all, delete-orphan", back_populates="item")
+
+class OrderItemOptionArchive(Base):
+    __tablename__ = "order_item_options_archive"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    item_id: Mapped[int] = mapped_column(ForeignKey("order_items_archive.id", ondelete="CASCADE"), index=True)
+    option_item_id: Mapped[int] = mapped_column(ForeignKey("option_items.id", ondelete="SET NULL"), nullable=True)
+    name_snapshot: Mapped[str] = mapped_column(String(120))
+    price: Mapped[float] = mapped_column(Numeric(12,2))
+
+    item = relationship("OrderItemArchive", back_populates="options")
+
+# ---- Sales rollups ----
+# Агрегаты по локальному (Asia/Almaty) дню/часу; ведутся в транзакциях
+# create_order/close_order, чтобы дашборд не сканировал orders.
+class SalesHourly(Base):
+    __tablename__ = "sales_hourly"
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    hour: Mapped[int] = mapped_column(SmallInteger, primary_key=True)
+    orders: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    revenue: Mapped[float] = mapped_column(Numeric(14,2), default=0, server_default="0")
+    take_away_orders: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    take_away_revenue: Mapped[float] = mapped_column(Numeric(14,2), default=0, server_default="0")
+    closed_orders: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+
+class SalesDaily(Base):
+    __tablename__ = "sales_daily"
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    orders: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    revenue: Mapped[float] = mapped_column(Numeric(14,2), default=0, server_default="0")
+    take_away_orders: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    take_away_revenue: Mapped[float] = mapped_column(Numeric(14,2), default=0, server_default="0")
+    closed_orders: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
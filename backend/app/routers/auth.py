@@ -1,11 +1,13 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Response, Request
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
-from ..database import get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..database import get_async_db
 from .. import models
 from ..utils.security import (
-    hash_password, verify_password, create_access_token,
-    set_access_cookie, clear_access_cookie, get_current_user
+    hash_password_async, verify_password_async, create_access_token,
+    set_access_cookie, clear_access_cookie, get_current_user,
+    invalidate_users, Principal,
 )
 from ..schemas import Token, UserOut
 
@@ -23,47 +25,51 @@ async def _take_payload(request: Request):
     password = data.get("password") or ""
     return name, phone, password
 
+async def _find_user(db: AsyncSession, phone: str) -> models.User | None:
+    return (await db.scalars(select(models.User).filter(models.User.phone == phone))).first()
+
 @router.post("/register", response_model=UserOut)
-async def register(request: Request, response: Response, db: Session = Depends(get_db)):
+async def register(request: Request, response: Response, db: AsyncSession = Depends(get_async_db)):
     name, phone, password = await _take_payload(request)
     if not name or not phone or not password:
         raise HTTPException(400, detail="name, phone (или phone_number), password — обязательны")
-    if db.query(models.User).filter(models.User.phone == phone).first():
+    if await _find_user(db, phone):
         raise HTTPException(400, detail="Phone already registered")
 
-    is_first = db.query(models.User).first() is None
+    is_first = (await db.scalars(select(models.User).limit(1))).first() is None
     user = models.User(
         name=name, phone=phone,
-        password_hash=hash_password(password),
+        password_hash=await hash_password_async(password),
         role=models.Role.admin if is_first else models.Role.admin
     )
-    db.add(user); db.commit(); db.refresh(user)
+    db.add(user); await db.commit(); await db.refresh(user)
+    invalidate_users()
 
     token = create_access_token(sub=user.phone)
     set_access_cookie(response, token)
     return user
 
 @router.post("/login", response_model=Token)
-async def login_json(request: Request, response: Response, db: Session = Depends(get_db)):
+async def login_json(request: Request, response: Response, db: AsyncSession = Depends(get_async_db)):
     _, phone, password = await _take_payload(request)
-    user = db.query(models.User).filter(models.User.phone == phone).first()
-    if not user or not verify_password(password, user.password_hash):
+    user = await _find_user(db, phone)
+    if not user or not await verify_password_async(password, user.password_hash):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
     token = create_access_token(sub=user.phone)
     set_access_cookie(response, token)
     return Token(access_token=token)
 
 @router.post("/token", response_model=Token)  # фолбэк OAuth2 form
-def login_form(response: Response, form: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.phone == form.username).first()
-    if not user or not verify_password(form.password, user.password_hash):
+async def login_form(response: Response, form: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
+    user = await _find_user(db, form.username)
+    if not user or not await verify_password_async(form.password, user.password_hash):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
     token = create_access_token(sub=user.phone)
     set_access_cookie(response, token)
     return Token(access_token=token)
 
 @router.get("/me", response_model=UserOut)
-def me(user: models.User = Depends(get_current_user)):
+def me(user: Principal = Depends(get_current_user)):
     return user
 
 @router.post("/logout")
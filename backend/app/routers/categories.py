@@ -1,12 +1,12 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Request
 from typing import List
-from ..database import get_db
-from .. import models
 from ..schemas import CategoryOut
+from ..utils.catalog import catalog
+from ..utils.http_cache import etag_json
 
 router = APIRouter(prefix="/categories", tags=["categories"])
 
 @router.get("", response_model=List[CategoryOut])
-def list_categories(db: Session = Depends(get_db)):
-    return db.query(models.Category).order_by(models.Category.name).all()
+def list_categories(request: Request):
+    snap = catalog.get()
+    return etag_json(request, snap.version, lambda: snap.categories)
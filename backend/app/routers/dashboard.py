@@ -1,66 +1,82 @@
-from fastapi import APIRouter, Depends, WebSocket
-from sqlalchemy import func, extract
-from sqlalchemy.orm import Session
-from ..database import get_db
+from datetime import date
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, WebSocket
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..database import get_async_db, SessionLocal
 from .. import models
 from ..schemas import DashboardStats, HourPoint, RecentOrder
 from ..utils.broadcast import hub
+from ..utils.refresh import refresher
+from ..utils.cache import VersionedCache
+from ..utils.jsonenc import iter_json_object
+from ..utils import reports
+from ..utils.timerange import local_today, month_days
+from ..utils.security import require_admin
+from ..config import settings
 
 router = APIRouter(prefix="/dashboard", tags=["dashboard"])
 
-KZ_TZ = "Asia/Almaty"
 
+_cache = VersionedCache(settings.dashboard_cache_ttl)
 
-@router.get("/stats", response_model=DashboardStats)
-def stats(db: Session = Depends(get_db)):
-    now = func.now()
-    local_day = func.date(func.timezone(KZ_TZ, now))
-    local_year = extract('year', func.timezone(KZ_TZ, now))
-    local_month = extract('month', func.timezone(KZ_TZ, now))
-
-    day_sum = db.query(func.coalesce(func.sum(models.Order.total), 0)).filter(
-        func.date(func.timezone(KZ_TZ, models.Order.created_at)) == local_day
-    ).scalar() or 0
-
-    month_sum = db.query(func.coalesce(func.sum(models.Order.total), 0)).filter(
-        extract('year', func.timezone(KZ_TZ, models.Order.created_at)) == local_year,
-        extract('month', func.timezone(KZ_TZ, models.Order.created_at)) == local_month
-    ).scalar() or 0
-
-    day_count = db.query(func.count(models.Order.id)).filter(
-        func.date(func.timezone(KZ_TZ, models.Order.created_at)) == local_day
-    ).scalar() or 0
-
-    month_count = db.query(func.count(models.Order.id)).filter(
-        extract('year', func.timezone(KZ_TZ, models.Order.created_at)) == local_year,
-        extract('month', func.timezone(KZ_TZ, models.Order.created_at)) == local_month
-    ).scalar() or 0
+
+async def _compute_stats(db: AsyncSession, day: date) -> DashboardStats:
+    # не больше 31 строки sales_daily: месяц целиком, день — через FILTER
+    d = models.SalesDaily
+    first, nxt = month_days(day)
+    today = d.day == day
+    day_sum, month_sum, day_count, month_count = (await db.execute(
+        select(
+            func.coalesce(func.sum(d.revenue).filter(today), 0),
+            func.coalesce(func.sum(d.revenue), 0),
+            func.coalesce(func.sum(d.orders).filter(today), 0),
+            func.coalesce(func.sum(d.orders), 0),
+        ).filter(d.day >= first, d.day < nxt)
+    )).one()
 
     return DashboardStats(
-        day_sales=float(day_sum),
-        month_sales=float(month_sum),
-        day_orders=day_count,
-        month_orders=month_count
+        day_sales=float(day_sum or 0),
+        month_sales=float(month_sum or 0),
+        day_orders=int(day_count or 0),
+        month_orders=int(month_count or 0)
     )
 
 
+@router.get("/stats", response_model=DashboardStats)
+async def stats(db: AsyncSession = Depends(get_async_db)):
+    # версия канала dashboard растёт на каждой мутации заказов (на всех воркерах)
+    day = local_today()
+    key = (refresher.version.get("dashboard", 0), day)
+    return await _cache.aget("stats", key, lambda: _compute_stats(db, day))
+
+
 @router.get("/hourly-summary", response_model=list[HourPoint])
-def hourly(db: Session = Depends(get_db)):
-    rows = db.query(
-        extract('hour', func.timezone(KZ_TZ, models.Order.created_at)).label('h'),
-        func.count(models.Order.id)
-    ).group_by('h').order_by('h').all()
-    return [HourPoint(hour=int(h), orders=int(c)) for h, c in rows]
+async def hourly(
+    db: AsyncSession = Depends(get_async_db),
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+):
+    # без from/to — за всё время, как раньше; границы — локальные даты включительно
+    h = models.SalesHourly
+    total = func.sum(h.orders)
+    q = select(h.hour, total)
+    if date_from:
+        q = q.filter(h.day >= date_from)
+    if date_to:
+        q = q.filter(h.day <= date_to)
+    rows = (await db.execute(q.group_by(h.hour).having(total > 0).order_by(h.hour))).all()
+    return [HourPoint(hour=int(hr), orders=int(c)) for hr, c in rows]
 
 
 @router.get("/recent-orders", response_model=list[RecentOrder])
-def recent(limit: int = 5, db: Session = Depends(get_db)):
-    rows = (
-        db.query(models.Order)
+async def recent(limit: int = 5, db: AsyncSession = Depends(get_async_db)):
+    rows = (await db.scalars(
+        select(models.Order)
         .order_by(models.Order.created_at.desc())
         .limit(limit)
-        .all()
-    )
+    )).all()
     return [
         RecentOrder(
             id=o.guest_seq,  # показываем дневной номер
@@ -72,12 +88,47 @@ def recent(limit: int = 5, db: Session = Depends(get_db)):
     ]
 
 
-async def push_dashboard(db: Session):
-    await hub.send("dashboard", {
-        "stats": stats(db),
-        "hourly": hourly(db),
-        "recent": recent(5, db),
-    })
+@router.get("/report")
+def report(
+    date_from: date = Query(..., alias="from"),
+    date_to: date = Query(..., alias="to"),
+    granularity: reports.Granularity = "day",
+    _admin=Depends(require_admin),
+):
+    """
+    Продажи за период (локальные даты, to включительно): ряд по времени
+    и разбивка по товарам/категориям. Ответ — один JSON-объект, отдаваемый потоком.
+    """
+    if date_from > date_to:
+        raise HTTPException(400, detail="'from' must not be after 'to'")
+
+    def body():
+        # своя сессия: генератор живёт дольше зависимостей запроса
+        db = SessionLocal()
+        try:
+            yield from iter_json_object(
+                {"from": date_from, "to": date_to, "granularity": granularity},
+                {
+                    "series": reports.series(db, date_from, date_to, granularity),
+                    "products": reports.by_product(db, date_from, date_to),
+                    "categories": reports.by_category(db, date_from, date_to),
+                },
+            )
+        finally:
+            db.close()
+
+    return StreamingResponse(body(), media_type="application/json")
+
+
+async def _dashboard_snapshot(db: AsyncSession) -> dict:
+    return {
+        "stats": await stats(db),
+        "hourly": await hourly(db, None, None),
+        "recent": await recent(5, db),
+    }
+
+
+refresher.register("dashboard", _dashboard_snapshot)
 
 
 @router.websocket("/ws")
@@ -1,12 +1,15 @@
 from fastapi import APIRouter, Depends, HTTPException, WebSocket, Form, UploadFile, File, Request
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, selectinload
 from typing import List, Optional
 from ..database import get_db
 from .. import models
 from ..schemas import OptionGroupOut, OptionItemOut
 from ..utils.security import require_admin
 from ..utils.broadcast import hub
-from ..utils.files import save_image, remove_image
+from ..utils.refresh import refresher
+from ..utils.catalog import catalog
+from ..utils.http_cache import etag_json
+from ..utils.files import media_urls, save_image, set_image
 from ..config import settings
 
 router = APIRouter(prefix="/options", tags=["options"])
@@ -23,6 +26,16 @@ def _image_url_from_env(filename: Optional[str]) -> Optional[str]:
         return f"{settings.PUBLIC_MEDIA_URL.rstrip('/')}/{filename}"
     return f"/media/{filename}"
 
+def _load_group(db: Session, gid: int) -> Optional[models.OptionGroup]:
+    # пункты группы — одним запросом, без ленивой подгрузки в _group_dict_http
+    return (
+        db.query(models.OptionGroup)
+        .options(selectinload(models.OptionGroup.items))
+        .populate_existing()
+        .filter(models.OptionGroup.id == gid)
+        .one_or_none()
+    )
+
 def _item_dict_http(request: Request, it: models.OptionItem) -> dict:
     fname = getattr(it, "image_filename", None) or getattr(it, "image_path", None)
     return {
@@ -30,6 +43,7 @@ def _item_dict_http(request: Request, it: models.OptionItem) -> dict:
         "name": it.name,
         "price": float(it.price),
         "image_url": _image_url_abs(request, fname),
+        "image_urls": media_urls(lambda f: _image_url_abs(request, f), it.image_variants),
     }
 
 def _item_dict_ws(it: models.OptionItem) -> dict:
@@ -39,6 +53,7 @@ def _item_dict_ws(it: models.OptionItem) -> dict:
         "name": it.name,
         "price": float(it.price),
         "image_url": _image_url_from_env(fname),
+        "image_urls": media_urls(_image_url_from_env, it.image_variants),
     }
 
 def _group_dict_http(request: Request, g: models.OptionGroup) -> dict:
@@ -59,17 +74,25 @@ def _group_dict_ws(g: models.OptionGroup) -> dict:
         "items": [_item_dict_ws(it) for it in g.items],
     }
 
-async def _broadcast(db: Session):
-    groups = db.query(models.OptionGroup).all()
-    await hub.send("options", {"type": "options", "groups": [_group_dict_ws(g) for g in groups]})
+def _options_snapshot(_db: Session) -> dict:
+    # из снимка каталога — без запросов к БД
+    return {"type": "options", "groups": [_group_dict_ws(g) for g in catalog.get().groups]}
+
+
+refresher.register("options", _options_snapshot)
+
+
+def _broadcast():
+    # пересборка и рассылка — в фоне и на всех воркерах
+    refresher.mark("options")
 
 @router.get("/groups", response_model=List[OptionGroupOut])
-def list_groups(request: Request, db: Session = Depends(get_db)):
-    groups = db.query(models.OptionGroup).all()
-    return [_group_dict_http(request, g) for g in groups]
+def list_groups(request: Request):
+    snap = catalog.get()
+    return etag_json(request, snap.version, lambda: [_group_dict_http(request, g) for g in snap.groups])
 
 @router.post("/groups", response_model=OptionGroupOut)
-async def create_group(
+def create_group(
     request: Request,
     name: str = Form(...),
     select_type: models.SelectType = Form(models.SelectType.single),
@@ -80,12 +103,13 @@ async def create_group(
     if db.query(models.OptionGroup).filter(models.OptionGroup.name == name).first():
         raise HTTPException(400, detail="Group exists")
     g = models.OptionGroup(name=name, select_type=select_type, is_required=is_required)
-    db.add(g); db.commit(); db.refresh(g)
-    await _broadcast(db)
+    db.add(g); db.commit()
+    g = _load_group(db, g.id)
+    _broadcast()
     return _group_dict_http(request, g)
 
 @router.put("/groups/{gid}", response_model=OptionGroupOut)
-async def update_group(
+def update_group(
     gid: int,
     request: Request,
     name: str = Form(...),
@@ -94,29 +118,26 @@ async def update_group(
     db: Session = Depends(get_db),
     _ = Depends(require_admin),
 ):
-    g = db.query(models.OptionGroup).get(gid)
+    g = _load_group(db, gid)
     if not g:
         raise HTTPException(404, detail="Not found")
     g.name, g.select_type, g.is_required = name, select_type, is_required
-    db.commit(); db.refresh(g)
-    await _broadcast(db)
+    db.commit()
+    g = _load_group(db, g.id)
+    _broadcast()
     return _group_dict_http(request, g)
 
 @router.delete("/groups/{gid}")
-async def delete_group(gid: int, db: Session = Depends(get_db), _ = Depends(require_admin)):
-    g = db.query(models.OptionGroup).get(gid)
+def delete_group(gid: int, db: Session = Depends(get_db), _ = Depends(require_admin)):
+    g = _load_group(db, gid)
     if not g:
         raise HTTPException(404, detail="Not found")
-    for it in g.items:
-        old = getattr(it, "image_filename", None) or getattr(it, "image_path", None)
-        if old:
-            remove_image(old)
     db.delete(g); db.commit()
-    await _broadcast(db)
+    _broadcast()
     return {"ok": True}
 
 @router.post("/groups/{gid}/items", response_model=OptionItemOut)
-async def add_item(
+def add_item(
     gid: int,
     request: Request,
     name: str = Form(...),
@@ -128,18 +149,15 @@ async def add_item(
     g = db.query(models.OptionGroup).get(gid)
     if not g:
         raise HTTPException(404, detail="Group not found")
-    fname = save_image(image) if image else None
+    stored = save_image(image) if image else None
     it = models.OptionItem(group=g, name=name, price=price)
-    if hasattr(it, "image_filename"):
-        it.image_filename = fname
-    elif hasattr(it, "image_path"):
-        it.image_path = fname
+    set_image(it, stored)
     db.add(it); db.commit(); db.refresh(it)
-    await _broadcast(db)
+    _broadcast()
     return _item_dict_http(request, it)
 
 @router.put("/items/{iid}", response_model=OptionItemOut)
-async def edit_item(
+def edit_item(
     iid: int,
     request: Request,
     name: str = Form(...),
@@ -155,45 +173,31 @@ async def edit_item(
 
     it.name, it.price = name, price
 
-    current = getattr(it, "image_filename", None) or getattr(it, "image_path", None)
+    # файлы картинок не удаляем: неиспользуемое уберёт GC (utils/media_gc)
     if image:
-        newf = save_image(image)
-        if hasattr(it, "image_filename"):
-            it.image_filename = newf
-        elif hasattr(it, "image_path"):
-            it.image_path = newf
-        if current:
-            remove_image(current)
-    elif image_clear and current:
-        if hasattr(it, "image_filename"):
-            it.image_filename = None
-        elif hasattr(it, "image_path"):
-            it.image_path = None
-        remove_image(current)
+        set_image(it, save_image(image))
+    elif image_clear:
+        set_image(it, None)
 
     db.commit(); db.refresh(it)
-    await _broadcast(db)
+    _broadcast()
     return _item_dict_http(request, it)
 
 @router.delete("/items/{iid}")
-async def remove_item(iid: int, db: Session = Depends(get_db), _ = Depends(require_admin)):
+def remove_item(iid: int, db: Session = Depends(get_db), _ = Depends(require_admin)):
     it = db.query(models.OptionItem).get(iid)
     if not it:
         raise HTTPException(404, detail="Not found")
-    current = getattr(it, "image_filename", None) or getattr(it, "image_path", None)
-    if current:
-        remove_image(current)
     db.delete(it); db.commit()
-    await _broadcast(db)
+    _broadcast()
     return {"ok": True}
 
 @router.websocket("/ws")
-async def ws(ws: WebSocket, db: Session = Depends(get_db)):
+async def ws(ws: WebSocket):
     await hub.join("options", ws)
-    # отдадим актуальные данные сразу (через PUBLIC_MEDIA_URL)
-    groups = db.query(models.OptionGroup).all()
-    await ws.send_json({"type": "options", "groups": [_group_dict_ws(g) for g in groups]})
     try:
+        # отдадим актуальные данные сразу (через PUBLIC_MEDIA_URL)
+        await hub.send_to("options", ws, await refresher.snapshot("options"))
         while True:
             await ws.receive_text()
     except Exception:
@@ -1,19 +1,39 @@
-from fastapi import APIRouter, Depends, HTTPException, WebSocket
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from datetime import datetime, timezone
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, WebSocket
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+import csv, io, json
+from datetime import date, datetime, timezone
+from typing import Iterator, List, Literal, Optional
 
-from ..database import get_db
+from ..database import get_async_db, SessionLocal
 from .. import models
 from ..schemas import OrderCreateIn, OrderOut, OrderItemOut, OrdersFeed
 from ..utils.security import get_current_user
 from ..utils.broadcast import hub
-from . import dashboard as dashboard_router
+from ..utils.refresh import refresher
+from ..utils.jsonenc import dumps
+from ..utils.timerange import day_range, in_range, local_today
+from ..utils import archive, rollup
 
 router = APIRouter(prefix="/orders", tags=["orders"])
 
-KZ_TZ = "Asia/Almaty"
+# Версия протокола /orders/ws:
+#   сервер -> клиент:
+#     {"type": "orders", "v", "seq", "active", "recent_closed"}  — полный снимок
+#     {"type": "order_added",    "v", "seq", "order"}
+#     {"type": "order_closed",   "v", "seq", "order"}
+#     {"type": "closed_cleared", "v", "seq"}
+#   клиент -> сервер:
+#     {"type": "resync"} — при пропуске seq; в ответ придёт полный снимок.
+# Снимок с seq = N отражает все события с seq <= N (и, возможно, часть
+# более поздних). События, пришедшие до снимка, клиент откладывает и после
+# снимка применяет те, у которых seq > N. Дельты идемпотентны по order.pk
+# (order.id — дневной номер, он повторяется между днями).
+ORDERS_PROTOCOL = 2
+RECENT_CLOSED = 10
 
 
 def _order_to_out(o: models.Order) -> OrderOut:
@@ -24,6 +44,7 @@ def _order_to_out(o: models.Order) -> OrderOut:
         items.append(OrderItemOut(name=name, quantity=it.qty))
     return OrderOut(
         id=o.guest_seq,  # <- фронту отдаём дневной номер
+        pk=o.id,
         customer_name=o.customer_name,
         take_away=o.take_away,
         items=items,
@@ -32,66 +53,116 @@ def _order_to_out(o: models.Order) -> OrderOut:
     )
 
 
-async def _broadcast_refresh(db: Session):
-    act = (
-        db.query(models.Order)
+def _orders_q():
+    # позиции и их опции — двумя IN-запросами на всю выборку, а не по запросу
+    # на каждый заказ/позицию; число запросов не зависит от длины очереди
+    return select(models.Order).options(
+        selectinload(models.Order.items).selectinload(models.OrderItem.options)
+    )
+
+
+async def _load_order(db: AsyncSession, pk: int) -> models.Order:
+    # populate_existing: позиции перечитываются, даже если заказ уже в сессии
+    q = _orders_q().filter(models.Order.id == pk).execution_options(populate_existing=True)
+    return (await db.scalars(q)).one()
+
+
+async def _feed_rows(db: AsyncSession, recent: int):
+    act = (await db.scalars(
+        _orders_q()
         .filter(models.Order.status == models.OrderStatus.active)
         .order_by(models.Order.created_at.asc())
-        .all()
-    )
-    cls = (
-        db.query(models.Order)
+    )).all()
+    cls = (await db.scalars(
+        _orders_q()
         .filter(models.Order.status == models.OrderStatus.closed)
         .order_by(models.Order.closed_at.desc())
-        .limit(10)
-        .all()
-    )
-    payload = {
+        .limit(recent)
+    )).all()
+    return act, cls
+
+
+async def _orders_snapshot(db: AsyncSession) -> dict:
+    act, cls = await _feed_rows(db, RECENT_CLOSED)
+    return {
         "type": "orders",
-        "active": [_order_to_out(x).model_dump() for x in act],
-        "recent_closed": [_order_to_out(x).model_dump() for x in cls],
+        "v": ORDERS_PROTOCOL,
+        "active": [_order_to_out(x) for x in act],
+        "recent_closed": [_order_to_out(x) for x in cls],
     }
-    await hub.send("orders", payload)
-    await dashboard_router.push_dashboard(db)
+
+
+refresher.register("orders", _orders_snapshot)
+
+
+async def _next_guest_seq(db: AsyncSession) -> int:
+    """
+    Следующий дневной номер: один UPSERT по первичному ключу daily_counters.
+    Строка дня блокируется до конца транзакции заказа, поэтому две кассы
+    не получат один номер, а при откате номер не «сгорает».
+    """
+    counter = models.DailyCounter
+    stmt = (
+        pg_insert(counter)
+        .values(day=local_today(), last_seq=1)
+        .on_conflict_do_update(
+            index_elements=[counter.day],
+            set_={"last_seq": counter.last_seq + 1},
+        )
+        .returning(counter.last_seq)
+    )
+    return (await db.execute(stmt)).scalar_one()
+
+
+def _broadcast_event(kind: str, order: OrderOut | None = None):
+    # не ждём рассылку: дельта и снимок дашборда уйдут в фоне, в окне склейки
+    event = {"type": kind, "v": ORDERS_PROTOCOL}
+    if order is not None:
+        event["order"] = order
+    refresher.emit("orders", event)
+    refresher.mark("dashboard")
 
 
 @router.post("", response_model=OrderOut, status_code=201)
 async def create_order(
     body: OrderCreateIn,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     _user=Depends(get_current_user),
 ):
     if not body.items:
         raise HTTPException(400, detail="Empty cart")
 
-    # считаем максимум за «сегодня» по Asia/Almaty и +1
-    max_seq = (
-        db.query(func.coalesce(func.max(models.Order.guest_seq), 0))
-        .filter(
-            func.date(func.timezone(KZ_TZ, models.Order.guest_date))
-            == func.date(func.timezone(KZ_TZ, func.now()))
-        )
-        .scalar()
-    )
-    next_seq = int(max_seq) + 1
-
     order = models.Order(
         customer_name=(body.customer_name or "").strip() or "Гость",
         take_away=body.take_away,
         total=0,
-        guest_seq=next_seq,
-        # храним UTC, сравнение выше уже через timezone()
+        # храним UTC; «день» номера считается по Asia/Almaty
         guest_date=datetime.now(timezone.utc),
     )
-    db.add(order)
-    db.flush()
+
+    # вся корзина — двумя запросами: товары и опции одним IN каждый
+    prod_ids = {it.product_id for it in body.items}
+    products = {
+        p.id: p
+        for p in await db.scalars(select(models.Product).filter(models.Product.id.in_(prod_ids)))
+    }
+    missing = next((it.product_id for it in body.items if it.product_id not in products), None)
+    if missing is not None:
+        raise HTTPException(400, detail=f"Product {missing} not found")
+
+    opt_ids = {oid for it in body.items for oid in it.option_item_ids}
+    option_items = (
+        {
+            op.id: op
+            for op in await db.scalars(select(models.OptionItem).filter(models.OptionItem.id.in_(opt_ids)))
+        }
+        if opt_ids
+        else {}
+    )
 
     total = 0.0
     for it in body.items:
-        prod = db.query(models.Product).get(it.product_id)
-        if not prod:
-            raise HTTPException(400, detail=f"Product {it.product_id} not found")
-
+        prod = products[it.product_id]
         unit = (
             float(it.unit_price_base)
             if it.unit_price_base is not None
@@ -100,78 +171,196 @@ async def create_order(
         name_snap = prod.name + (it.name_suffix or "")
 
         item = models.OrderItem(
-            order=order,
             product=prod,
             name_snapshot=name_snap,
-            unit_price=unit,
             qty=it.qty,
         )
-        db.add(item)
-        db.flush()
-
-        if it.option_item_ids:
-            opts = (
-                db.query(models.OptionItem)
-                .filter(models.OptionItem.id.in_(it.option_item_ids))
-                .all()
-            )
-            for op in opts:
-                db.add(
-                    models.OrderItemOption(
-                        item=item,
-                        option_item=op,
-                        name_snapshot=op.name,
-                        price=op.price,
-                    )
+        # повторы id схлопываем, несуществующие пропускаем — как раньше с IN
+        for oid in dict.fromkeys(it.option_item_ids):
+            op = option_items.get(oid)
+            if op is None:
+                continue
+            item.options.append(
+                models.OrderItemOption(
+                    option_item=op,
+                    name_snapshot=op.name,
+                    price=op.price,
                 )
-                unit += float(op.price)
+            )
+            unit += float(op.price)
 
-        total += unit * it.qty
         item.unit_price = unit
+        order.items.append(item)
+        total += unit * it.qty
 
     order.total = total
-    db.commit()
-    db.refresh(order)
-    await _broadcast_refresh(db)
-    return _order_to_out(order)
+    # номер берём последним: строка счётчика дня заблокирована до commit,
+    # и параллельные кассы не должны ждать, пока мы проверяем корзину
+    order.guest_seq = await _next_guest_seq(db)
+    # один flush: заказ, позиции и опции — пакетными INSERT
+    db.add(order)
+    await db.flush()
+    # rollup — синхронные хелперы; run_sync выполняет их в той же транзакции
+    await db.run_sync(rollup.record_order_created, total, order.take_away)
+    oid = order.id
+    await db.commit()
+    order = await _load_order(db, oid)
+    out = _order_to_out(order)
+    _broadcast_event("order_added", out)
+    return out
 
 
 @router.get("", response_model=List[OrderOut])
 async def list_orders(
+    response: Response,
     status: models.OrderStatus = models.OrderStatus.active,
     limit: int = 50,
-    db: Session = Depends(get_db),
+    after_id: Optional[int] = None,
+    after_created_at: Optional[datetime] = None,
+    after_closed_at: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_async_db),
     _user=Depends(get_current_user),
 ):
-    q = db.query(models.Order).filter(models.Order.status == status)
+    """
+    Keyset-пагинация: следующая страница — по ключам последней строки
+    из заголовков X-Next-After-* (after_id — настоящий id, не дневной номер).
+    """
+    o = models.Order
+    q = _orders_q().filter(o.status == status)
     if status == models.OrderStatus.active:
-        q = q.order_by(models.Order.created_at.asc())
+        if after_id is not None and after_created_at is not None:
+            q = q.filter(tuple_(o.created_at, o.id) > tuple_(after_created_at, after_id))
+        q = q.order_by(o.created_at.asc(), o.id.asc())
     else:
-        q = q.order_by(models.Order.closed_at.desc())
-    rows = q.limit(limit).all()
+        if after_id is not None and after_closed_at is not None:
+            q = q.filter(tuple_(o.closed_at, o.id) < tuple_(after_closed_at, after_id))
+        q = q.order_by(o.closed_at.desc(), o.id.desc())
+    rows = (await db.scalars(q.limit(limit))).all()
+
+    if rows and len(rows) == limit:
+        last = rows[-1]
+        response.headers["X-Next-After-Id"] = str(last.id)
+        if status == models.OrderStatus.active:
+            response.headers["X-Next-After-Created-At"] = last.created_at.isoformat()
+        else:
+            response.headers["X-Next-After-Closed-At"] = last.closed_at.isoformat()
     return [_order_to_out(x) for x in rows]
 
 
+_EXPORT_BATCH = 500
+_CSV_COLUMNS = [
+    "order_id", "guest_seq", "customer_name", "take_away", "total",
+    "created_at", "closed_at", "item", "qty", "unit_price", "options",
+]
+
+
+def _iter_closed(db: Session, date_from: Optional[date], date_to: Optional[date]):
+    """
+    Закрытые заказы: сначала архив, затем «горячая» таблица — по closed_at.
+    Серверный курсор: в памяти не больше одной пачки заказов с позициями.
+    """
+    for o, item in (
+        (models.OrderArchive, models.OrderItemArchive),
+        (models.Order, models.OrderItem),
+    ):
+        q = db.query(o).options(selectinload(o.items).selectinload(item.options))
+        if o is models.Order:
+            q = q.filter(o.status == models.OrderStatus.closed)
+        if date_from:
+            q = q.filter(o.closed_at >= day_range(date_from)[0])
+        if date_to:
+            q = q.filter(o.closed_at < day_range(date_to)[1])
+        yield from q.order_by(o.closed_at.asc(), o.id.asc()).yield_per(_EXPORT_BATCH)
+
+
+def _export_ndjson(orders) -> Iterator[bytes]:
+    for o in orders:
+        yield dumps({
+            "id": o.id,
+            "guest_seq": o.guest_seq,
+            "customer_name": o.customer_name,
+            "take_away": o.take_away,
+            "total": o.total,
+            "created_at": o.created_at,
+            "closed_at": o.closed_at,
+            "items": [
+                {
+                    "name": it.name_snapshot,
+                    "qty": it.qty,
+                    "unit_price": it.unit_price,
+                    "options": [{"name": op.name_snapshot, "price": op.price} for op in it.options],
+                }
+                for it in o.items
+            ],
+        }) + b"\n"
+
+
+def _export_csv(orders) -> Iterator[str]:
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    w.writerow(_CSV_COLUMNS)
+    for o in orders:
+        # одна строка на позицию; данные заказа повторяются
+        for it in o.items:
+            w.writerow([
+                o.id, o.guest_seq, o.customer_name, int(o.take_away), o.total,
+                o.created_at.isoformat(), o.closed_at.isoformat() if o.closed_at else "",
+                it.name_snapshot, it.qty, it.unit_price,
+                "; ".join(op.name_snapshot for op in it.options),
+            ])
+        if buf.tell() > 64 * 1024:
+            yield buf.getvalue()
+            buf.seek(0); buf.truncate()
+    yield buf.getvalue()
+
+
+@router.get("/export")
+def export_closed(
+    format: Literal["csv", "ndjson"] = "csv",
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    _user=Depends(get_current_user),
+):
+    """Выгрузка закрытых заказов с позициями и опциями потоком (локальные даты, to включительно)."""
+    def body():
+        # своя сессия: генератор живёт дольше зависимостей запроса
+        db = SessionLocal()
+        try:
+            orders = _iter_closed(db, date_from, date_to)
+            yield from (_export_csv(orders) if format == "csv" else _export_ndjson(orders))
+        finally:
+            db.close()
+
+    if format == "csv":
+        media_type, ext = "text/csv; charset=utf-8", "csv"
+    else:
+        media_type, ext = "application/x-ndjson", "ndjson"
+    return StreamingResponse(
+        body(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="orders.{ext}"'},
+    )
+
+
 @router.patch("/{oid}/close", response_model=OrderOut)
 async def close_order(
-    oid: int, db: Session = Depends(get_db), _user=Depends(get_current_user)
+    oid: int, db: AsyncSession = Depends(get_async_db), _user=Depends(get_current_user)
 ):
     # 1) Ищем по дневному номеру (guest_seq) среди активных за СЕГОДНЯ (Asia/Almaty)
-    o = (
-        db.query(models.Order)
+    o = (await db.scalars(
+        _orders_q()
         .filter(
             models.Order.status == models.OrderStatus.active,
             models.Order.guest_seq == oid,
-            func.date(func.timezone(KZ_TZ, models.Order.guest_date))
-            == func.date(func.timezone(KZ_TZ, func.now())),
+            in_range(models.Order.guest_date, day_range()),
         )
         .order_by(models.Order.created_at.desc())
-        .first()
-    )
+        .limit(1)
+    )).first()
 
     # 2) Если не нашли — пробуем как реальный PK (на всякий случай)
     if not o:
-        o = db.query(models.Order).get(oid)
+        o = (await db.scalars(_orders_q().filter(models.Order.id == oid))).first()
 
     if not o:
         raise HTTPException(404, detail="Not found")
@@ -179,39 +368,34 @@ async def close_order(
     if o.status == models.OrderStatus.closed:
         return _order_to_out(o)
 
-    o.status = models.OrderStatus.closed
-    o.closed_at = datetime.now(timezone.utc)
-    db.commit(); db.refresh(o)
-    await _broadcast_refresh(db)
-    return _order_to_out(o)
+    # закрываем условным UPDATE: из двух параллельных закрытий строку меняет
+    # одно, и только оно считает rollup и шлёт событие
+    closed_at = (await db.execute(
+        update(models.Order)
+        .where(models.Order.id == o.id, models.Order.status == models.OrderStatus.active)
+        .values(status=models.OrderStatus.closed, closed_at=datetime.now(timezone.utc))
+        .returning(models.Order.closed_at)
+    )).scalar_one_or_none()
+    if closed_at is not None:
+        await db.run_sync(rollup.record_order_closed, closed_at)
+    await db.commit()
+    out = _order_to_out(await _load_order(db, o.id))
+    if closed_at is not None:
+        _broadcast_event("order_closed", out)
+    return out
 
 @router.delete("/closed")
-async def clear_closed(db: Session = Depends(get_db), _user=Depends(get_current_user)):
-    db.query(models.OrderItemOption).delete(synchronize_session=False)
-    db.query(models.OrderItem).delete(synchronize_session=False)
-    db.query(models.Order).filter(models.Order.status == models.OrderStatus.closed).delete(
-        synchronize_session=False
-    )
-    db.commit()
-    await _broadcast_refresh(db)
+async def clear_closed(db: AsyncSession = Depends(get_async_db), _user=Depends(get_current_user)):
+    # закрытые заказы не удаляем, а переносим в архив — отчёты их по-прежнему видят;
+    # активные заказы и их позиции не трогаются
+    await db.run_sync(archive.archive_closed)
+    _broadcast_event("closed_cleared")
     return {"ok": True}
 
 
 @router.get("/feed", response_model=OrdersFeed)
-async def feed(recent: int = 10, db: Session = Depends(get_db)):
-    act = (
-        db.query(models.Order)
-        .filter(models.Order.status == models.OrderStatus.active)
-        .order_by(models.Order.created_at.asc())
-        .all()
-    )
-    cls = (
-        db.query(models.Order)
-        .filter(models.Order.status == models.OrderStatus.closed)
-        .order_by(models.Order.closed_at.desc())
-        .limit(recent)
-        .all()
-    )
+async def feed(recent: int = 10, db: AsyncSession = Depends(get_async_db)):
+    act, cls = await _feed_rows(db, recent)
     return OrdersFeed(
         active=[_order_to_out(x) for x in act],
         recent_closed=[_order_to_out(x) for x in cls],
@@ -222,8 +406,16 @@ async def feed(recent: int = 10, db: Session = Depends(get_db)):
 async def ws(ws: WebSocket):
     await hub.join("orders", ws)
     try:
+        # стартовый снимок задаёт клиенту точку отсчёта seq
+        await hub.send_to("orders", ws, await refresher.snapshot("orders"))
         while True:
-            await ws.receive_text()
+            raw = await ws.receive_text()
+            try:
+                msg = json.loads(raw)
+            except ValueError:
+                continue
+            if isinstance(msg, dict) and msg.get("type") == "resync":
+                await hub.send_to("orders", ws, await refresher.snapshot("orders"))
     except Exception:
         pass
     finally:
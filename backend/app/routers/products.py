@@ -1,12 +1,16 @@
 from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException, Request, WebSocket
-from sqlalchemy.orm import Session
-from typing import Dict, List, Optional
+from sqlalchemy.orm import Session, joinedload, selectinload
+from typing import Callable, Dict, List, Optional
 from ..database import get_db
 from .. import models
 from ..schemas import ProductOut
 from ..utils.security import require_admin
 from ..utils.broadcast import hub
-from ..utils.files import save_image, remove_image
+from ..utils.refresh import refresher
+from ..utils.catalog import ProductEntry, catalog
+from ..utils.http_cache import etag_json
+from ..utils.reports import NO_CATEGORY
+from ..utils.files import media_urls, save_image, set_image
 from ..config import settings
 
 router = APIRouter(prefix="/products", tags=["products"])
@@ -25,64 +29,90 @@ def _media_url_from_env(filename: Optional[str]) -> Optional[str]:
     # запасной вариант (относительный) – если переменная не задана
     return f"/media/{filename}"
 
+def _load_product(db: Session, pid: int) -> Optional[models.Product]:
+    # категория и группы опций — сразу, без ленивых запросов в _product_out
+    return (
+        db.query(models.Product)
+        .options(joinedload(models.Product.category), selectinload(models.Product.option_groups))
+        .populate_existing()
+        .filter(models.Product.id == pid)
+        .one_or_none()
+    )
+
 def _product_out(request: Request, p: models.Product) -> ProductOut:
     fname = getattr(p, "image_filename", None) or getattr(p, "image_path", None)
+    url = lambda f: _media_url_abs(request, f)
     return ProductOut(
         id=p.id,
         name=p.name,
         base_price=float(p.base_price),
         description=p.description,
         category_name=p.category.name if p.category else None,
-        image_url=_media_url_abs(request, fname),
+        image_url=url(fname),
+        image_urls=media_urls(url, p.image_variants),
         option_group_ids=[g.id for g in p.option_groups],
     )
 
-def _by_category_http(request: Request, db: Session) -> Dict[str, List[dict]]:
-    rows = db.query(models.Product).outerjoin(models.Category).all()
+def _entry_out(request: Request, p: ProductEntry) -> ProductOut:
+    url = lambda f: _media_url_abs(request, f)
+    return ProductOut(
+        id=p.id,
+        name=p.name,
+        base_price=p.base_price,
+        description=p.description,
+        category_name=p.category_name,
+        image_url=url(p.image_filename),
+        image_urls=media_urls(url, p.image_variants),
+        option_group_ids=list(p.option_group_ids),
+    )
+
+def _by_category(url: Callable[[Optional[str]], Optional[str]]) -> Dict[str, List[dict]]:
+    # из снимка каталога — без запросов к БД
     out: Dict[str, List[dict]] = {}
-    for p in rows:
-        cat = p.category.name if p.category else "Без категории"
-        fname = getattr(p, "image_filename", None) or getattr(p, "image_path", None)
-        out.setdefault(cat, []).append({
+    for p in catalog.get().products:
+        out.setdefault(p.category_name or NO_CATEGORY, []).append({
             "id": p.id,
             "name": p.name,
-            "price": float(p.base_price),
-            "image_url": _media_url_abs(request, fname),
+            "price": p.base_price,
+            "image_url": url(p.image_filename),
+            "image_urls": media_urls(url, p.image_variants),
         })
     return out
 
-def _by_category_ws(db: Session) -> Dict[str, List[dict]]:
+def _by_category_http(request: Request) -> Dict[str, List[dict]]:
+    return _by_category(lambda fname: _media_url_abs(request, fname))
+
+def _by_category_ws() -> Dict[str, List[dict]]:
     # для WebSocket используем PUBLIC_MEDIA_URL
-    rows = db.query(models.Product).outerjoin(models.Category).all()
-    out: Dict[str, List[dict]] = {}
-    for p in rows:
-        cat = p.category.name if p.category else "Без категории"
-        fname = getattr(p, "image_filename", None) or getattr(p, "image_path", None)
-        out.setdefault(cat, []).append({
-            "id": p.id,
-            "name": p.name,
-            "price": float(p.base_price),
-            "image_url": _media_url_from_env(fname),
-        })
-    return out
+    return _by_category(_media_url_from_env)
+
+def _products_snapshot(_db: Session) -> dict:
+    return {"by_category": _by_category_ws()}
+
 
-async def _push_products(db: Session):
-    await hub.send("products", {"by_category": _by_category_ws(db)})
+refresher.register("products", _products_snapshot)
+
+
+def _push_products():
+    # пересборка и рассылка — в фоне и на всех воркерах
+    refresher.mark("products")
 
 @router.get("")
-def list_grouped(request: Request, db: Session = Depends(get_db)):
+def list_grouped(request: Request):
     # В HTTP-ответе – абсолютные URLs
-    return _by_category_http(request, db)
+    return etag_json(request, catalog.get().version, lambda: _by_category_http(request))
 
 @router.get("/{pid}", response_model=ProductOut)
-def get_one(pid: int, request: Request, db: Session = Depends(get_db)):
-    p = db.query(models.Product).get(pid)
+def get_one(pid: int, request: Request):
+    p = catalog.get().products_by_id.get(pid)
     if not p:
         raise HTTPException(404, detail="Not found")
-    return _product_out(request, p)
+    return _entry_out(request, p)
 
+# мутации — обычные def: синхронная сессия и запись файла идут в threadpool,
+# а не на event loop
 @router.post("", response_model=ProductOut)
-async def create(
+def create(
     request: Request,
     name: str = Form(...),
     base_price: float = Form(...),
@@ -98,25 +128,23 @@ async def create(
         cat = models.Category(name=category_name)
         db.add(cat); db.flush()
 
-    filename = save_image(image) if image else None
+    stored = save_image(image) if image else None
 
     p = models.Product(name=name, base_price=base_price, description=description, category=cat)
-    if hasattr(p, "image_filename"):
-        p.image_filename = filename
-    elif hasattr(p, "image_path"):
-        p.image_path = filename
+    set_image(p, stored)
 
     if option_group_ids:
         ids = [int(x) for x in option_group_ids.split(",") if x]
         groups = db.query(models.OptionGroup).filter(models.OptionGroup.id.in_(ids)).all()
         p.option_groups = groups
 
-    db.add(p); db.commit(); db.refresh(p)
-    await _push_products(db)
+    db.add(p); db.commit()
+    p = _load_product(db, p.id)
+    _push_products()
     return _product_out(request, p)
 
 @router.put("/{pid}", response_model=ProductOut)
-async def update(
+def update(
     pid: int,
     request: Request,
     name: str = Form(...),
@@ -128,7 +156,7 @@ async def update(
     db: Session = Depends(get_db),
     _admin = Depends(require_admin),
 ):
-    p = db.query(models.Product).get(pid)
+    p = _load_product(db, pid)
     if not p:
         raise HTTPException(404, detail="Not found")
 
@@ -142,43 +170,36 @@ async def update(
     p.description = description
     p.category = cat
 
-    prev = getattr(p, "image_filename", None) or getattr(p, "image_path", None)
+    # старые файлы не трогаем: их могут использовать другие записи,
+    # а commit ещё может не пройти — неиспользуемое уберёт GC
     if image:
-        new_name = save_image(image)
-        if hasattr(p, "image_filename"):
-            p.image_filename = new_name
-        elif hasattr(p, "image_path"):
-            p.image_path = new_name
-        if prev:
-            remove_image(prev)
+        set_image(p, save_image(image))
 
     if option_group_ids is not None:
         ids = [int(x) for x in option_group_ids.split(",") if x]
         groups = db.query(models.OptionGroup).filter(models.OptionGroup.id.in_(ids)).all()
         p.option_groups = groups
 
-    db.commit(); db.refresh(p)
-    await _push_products(db)
+    db.commit()
+    p = _load_product(db, p.id)
+    _push_products()
     return _product_out(request, p)
 
 @router.delete("/{pid}")
-async def delete(pid: int, db: Session = Depends(get_db), _admin = Depends(require_admin)):
+def delete(pid: int, db: Session = Depends(get_db), _admin = Depends(require_admin)):
     p = db.query(models.Product).get(pid)
     if not p:
         raise HTTPException(404, detail="Not found")
-    prev = getattr(p, "image_filename", None) or getattr(p, "image_path", None)
-    if prev:
-        remove_image(prev)
     db.delete(p); db.commit()
-    await _push_products(db)
+    _push_products()
     return {"ok": True}
 
 @router.websocket("/ws")
-async def ws(ws: WebSocket, db: Session = Depends(get_db)):
+async def ws(ws: WebSocket):
     await hub.join("products", ws)
-    # сразу отдадим последнее состояние (через PUBLIC_MEDIA_URL)
-    await ws.send_json({"by_category": _by_category_ws(db)})
     try:
+        # сразу отдадим последнее состояние (через PUBLIC_MEDIA_URL)
+        await hub.send_to("products", ws, await refresher.snapshot("products"))
         while True:
             await ws.receive_text()
     except Exception:
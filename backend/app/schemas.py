@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Dict, Optional, List
 from datetime import datetime
 
 class Token(BaseModel):
@@ -25,6 +25,8 @@ class ProductOut(BaseModel):
     description: Optional[str]
     category_name: Optional[str]
     image_url: Optional[str]
+    # thumb/medium/full (WebP); у старых картинок — None
+    image_urls: Optional[Dict[str, str]] = None
     option_group_ids: List[int] = []
 
 class DashboardStats(BaseModel):
@@ -64,6 +66,8 @@ class OrderItemOut(BaseModel):
 
 class OrderOut(BaseModel):
     id: int
+    # настоящий id заказа; id выше — дневной номер и между днями повторяется
+    pk: int
     customer_name: str
     take_away: bool
     items: List[OrderItemOut]
@@ -79,6 +83,7 @@ class OptionItemOut(BaseModel):
     name: str
     price: float
     image_url: Optional[str] = None
+    image_urls: Optional[Dict[str, str]] = None
     class Config:
         from_attributes = True
 
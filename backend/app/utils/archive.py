@@ -0,0 +1,82 @@
+# app/utils/archive.py
+"""
+Перенос закрытых заказов в архивные таблицы.
+
+Каждая пачка — одна транзакция: копируем заказы, позиции и опции
+в *_archive и удаляем из orders (позиции и опции уходят каскадом FK).
+Отчёты и выгрузка читают обе части (см. utils/reports, /orders/export).
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+
+from .. import models
+from ..config import settings
+from ..database import SessionLocal
+
+log = logging.getLogger(__name__)
+
+_BATCH = 1000
+
+
+def _copy(db: Session, src, dst, cols: list[str], where) -> None:
+    db.execute(
+        insert(dst).from_select(cols, select(*(getattr(src, c) for c in cols)).where(where))
+    )
+
+
+def _move_batch(db: Session, ids: list[int]) -> None:
+    o, it, op = models.Order, models.OrderItem, models.OrderItemOption
+    _copy(db, o, models.OrderArchive,
+          ["id", "customer_name", "take_away", "total", "created_at", "closed_at", "guest_seq", "guest_date"],
+          o.id.in_(ids))
+    _copy(db, it, models.OrderItemArchive,
+          ["id", "order_id", "product_id", "name_snapshot", "unit_price", "qty"],
+          it.order_id.in_(ids))
+    _copy(db, op, models.OrderItemOptionArchive,
+          ["id", "item_id", "option_item_id", "name_snapshot", "price"],
+          op.item_id.in_(select(it.id).where(it.order_id.in_(ids))))
+    db.execute(delete(o).where(o.id.in_(ids)))
+
+
+def archive_closed(db: Session, closed_before: Optional[datetime] = None) -> int:
+    """Перенести закрытые заказы (все или закрытые раньше closed_before). Возвращает их число."""
+    o = models.Order
+    cond = [o.status == models.OrderStatus.closed]
+    if closed_before is not None:
+        cond.append(o.closed_at < closed_before)
+    moved = 0
+    while True:
+        # SKIP LOCKED: параллельные воркеры берут разные пачки
+        ids = db.scalars(
+            select(o.id).where(*cond).order_by(o.id).limit(_BATCH)
+            .with_for_update(skip_locked=True)
+        ).all()
+        if not ids:
+            return moved
+        _move_batch(db, ids)
+        db.commit()
+        moved += len(ids)
+
+
+def _run_once() -> int:
+    db = SessionLocal()
+    try:
+        cutoff = datetime.now(timezone.utc) - timedelta(days=settings.order_archive_after_days)
+        return archive_closed(db, cutoff)
+    finally:
+        db.close()
+
+
+async def archive_forever() -> None:
+    while True:
+        try:
+            moved = await asyncio.to_thread(_run_once)
+            if moved:
+                log.info("archived %d closed orders", moved)
+        except Exception:
+            log.exception("order archiving failed")
+        await asyncio.sleep(settings.order_archive_interval_minutes * 60)
@@ -1,31 +1,159 @@
 # app/utils/broadcast.py
-from typing import Dict, Set
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, Literal, Tuple
 from starlette.websockets import WebSocket
-import asyncio, json
+import asyncio, time
+
+from ..config import settings
+from .jsonenc import dumps_text
+
+SlowPolicy = Literal["drop_oldest", "disconnect"]
+
+
+@dataclass
+class ChannelStats:
+    sent: int = 0
+    dropped: int = 0
+    disconnected: int = 0
+    latency_ms_total: float = 0.0
+    latency_ms_max: float = 0.0
+
+    def observe(self, latency_ms: float):
+        self.sent += 1
+        self.latency_ms_total += latency_ms
+        self.latency_ms_max = max(self.latency_ms_max, latency_ms)
+
+
+class _Conn:
+    """
+    Одно подключение: своя ограниченная очередь и свой писатель.
+    В очереди пары (текст, это полный снимок). Снимки не вытесняются дельтами:
+    без снимка клиент не может применить ни одной дельты, а потерю дельты
+    он сам заметит по разрыву seq и попросит resync.
+    """
+
+    def __init__(self, hub: "Hub", channel: str, ws: WebSocket):
+        self.hub = hub
+        self.channel = channel
+        self.ws = ws
+        self.queue: Deque[Tuple[str, bool]] = deque()
+        self.ready = asyncio.Event()
+        self.writer = asyncio.create_task(self._write())
+
+    def offer(self, msg: str, snapshot: bool = False) -> None:
+        stats = self.hub.stats(self.channel)
+        if len(self.queue) >= self.hub.queue_size:
+            if self.hub.slow_policy == "disconnect":
+                stats.dropped += len(self.queue) + 1
+                self.hub._drop(self)
+                return
+            # drop_oldest: медленный клиент теряет старое, но получает свежее;
+            # сначала самая старая дельта, снимок — только ради более нового снимка
+            victim = next((i for i, (_, snap) in enumerate(self.queue) if not snap), None)
+            if victim is None and not snapshot:
+                stats.dropped += 1
+                return
+            del self.queue[victim if victim is not None else 0]
+            stats.dropped += 1
+        self.queue.append((msg, snapshot))
+        self.ready.set()
+
+    async def _write(self):
+        stats = self.hub.stats(self.channel)
+        try:
+            while True:
+                if not self.queue:
+                    self.ready.clear()
+                    await self.ready.wait()
+                    continue
+                msg, _ = self.queue.popleft()
+                started = time.perf_counter()
+                await asyncio.wait_for(self.ws.send_text(msg), self.hub.send_timeout)
+                stats.observe((time.perf_counter() - started) * 1000)
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            # таймаут или обрыв — отключаем, чтобы не копить очередь
+            self.hub._drop(self)
+
 
 class Hub:
-    def __init__(self):
-        self.channels: Dict[str, Set[WebSocket]] = {}
+    def __init__(
+        self,
+        queue_size: int = 32,
+        send_timeout: float = 5.0,
+        slow_policy: SlowPolicy = "drop_oldest",
+    ):
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        self.slow_policy = slow_policy
+        self.channels: Dict[str, Dict[WebSocket, _Conn]] = {}
+        self._stats: Dict[str, ChannelStats] = {}
+
+    def stats(self, channel: str) -> ChannelStats:
+        return self._stats.setdefault(channel, ChannelStats())
 
     async def join(self, channel: str, ws: WebSocket):
         await ws.accept()
-        self.channels.setdefault(channel, set()).add(ws)
+        self.channels.setdefault(channel, {})[ws] = _Conn(self, channel, ws)
 
     def leave(self, channel: str, ws: WebSocket):
-        self.channels.get(channel, set()).discard(ws)
+        conn = self.channels.get(channel, {}).pop(ws, None)
+        if conn:
+            conn.writer.cancel()
 
-    async def send(self, channel: str, payload: dict):
-        conns = list(self.channels.get(channel, set()))
-        if not conns:
+    def _drop(self, conn: _Conn):
+        if self.channels.get(conn.channel, {}).pop(conn.ws, None) is None:
             return
-        msg = json.dumps(payload, ensure_ascii=False)
-        living: list[WebSocket] = []
-        for ws in conns:
-            try:
-                await ws.send_text(msg)
-                living.append(ws)
-            except Exception:
-                pass
-        self.channels[channel] = set(living)
-
-hub = Hub()
+        self.stats(conn.channel).disconnected += 1
+        conn.writer.cancel()
+        asyncio.create_task(self._close(conn.ws))
+
+    @staticmethod
+    async def _close(ws: WebSocket):
+        try:
+            await ws.close()
+        except Exception:
+            pass
+
+    async def send(self, channel: str, payload):
+        """Ставит сообщение в очереди подписчиков; сами отправки не ждём."""
+        if self.channels.get(channel):
+            self.send_encoded(channel, dumps_text(payload), snapshot=False)
+
+    def send_encoded(self, channel: str, msg: str, snapshot: bool = True):
+        # один и тот же закодированный текст уходит всем подписчикам
+        for conn in list(self.channels.get(channel, {}).values()):
+            conn.offer(msg, snapshot)
+
+    async def send_to(self, channel: str, ws: WebSocket, payload):
+        """Снимок одному подписчику — через его же очередь, без гонок с рассылкой."""
+        conn = self.channels.get(channel, {}).get(ws)
+        if conn:
+            conn.offer(payload if isinstance(payload, str) else dumps_text(payload), snapshot=True)
+
+    def metrics(self) -> dict:
+        out = {}
+        for channel in set(self.channels) | set(self._stats):
+            conns = self.channels.get(channel, {}).values()
+            depths = [len(c.queue) for c in conns]
+            st = self.stats(channel)
+            out[channel] = {
+                "connections": len(depths),
+                "queue_depth": sum(depths),
+                "queue_depth_max": max(depths, default=0),
+                "sent": st.sent,
+                "dropped": st.dropped,
+                "disconnected": st.disconnected,
+                "send_latency_ms_avg": round(st.latency_ms_total / st.sent, 3) if st.sent else 0.0,
+                "send_latency_ms_max": round(st.latency_ms_max, 3),
+            }
+        return out
+
+
+hub = Hub(
+    queue_size=settings.ws_queue_size,
+    send_timeout=settings.ws_send_timeout,
+    slow_policy=settings.ws_slow_policy,
+)
@@ -0,0 +1,86 @@
+# app/utils/cache.py
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+
+class VersionedCache:
+    """
+    По одному значению на имя: живёт, пока не сменился ключ (версия данных)
+    и не истёк TTL. Безопасен для вызова из threadpool-хэндлеров.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._data: Dict[str, Tuple[Hashable, float, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _hit(self, name: str, key: Hashable, now: float) -> Tuple[bool, Any]:
+        with self._lock:
+            hit = self._data.get(name)
+        if hit and hit[0] == key and hit[1] > now:
+            return True, hit[2]
+        return False, None
+
+    def _put(self, name: str, key: Hashable, now: float, value: Any) -> None:
+        with self._lock:
+            self._data[name] = (key, now + self.ttl, value)
+
+    def get(self, name: str, key: Hashable, build: Callable[[], Any]) -> Any:
+        now = time.monotonic()
+        found, value = self._hit(name, key, now)
+        if not found:
+            value = build()
+            self._put(name, key, now, value)
+        return value
+
+    async def aget(self, name: str, key: Hashable, build: Callable[[], Awaitable[Any]]) -> Any:
+        """То же для async-хэндлеров: build — корутина."""
+        now = time.monotonic()
+        found, value = self._hit(name, key, now)
+        if not found:
+            value = await build()
+            self._put(name, key, now, value)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+class LRUCache:
+    """
+    Ограниченный кэш: у каждой записи свой срок жизни, при переполнении
+    вытесняется давно не читанная. Безопасен для вызова из threadpool.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            hit = self._data.get(key)
+            if hit is None:
+                return None
+            if hit[0] <= now:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return hit[1]
+
+    def put(self, key: Hashable, value: Any, ttl: float) -> None:
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
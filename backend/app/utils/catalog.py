@@ -0,0 +1,139 @@
+# app/utils/catalog.py
+"""
+MenuCatalog — неизменяемый снимок меню в памяти процесса.
+
+Меню меняется несколько раз в день, а читается на каждом экране POS, поэтому
+все чтения (HTTP и websocket) идут из снимка без запросов к БД. Снимок
+пересобирается лениво, когда сменилась версия каналов products/options:
+её поднимает любая админская мутация (через refresher, на всех воркерах).
+"""
+import threading
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+from sqlalchemy.orm import Session, joinedload, selectinload
+
+from .. import models
+from ..database import SessionLocal
+from .refresh import refresher
+
+
+@dataclass(frozen=True)
+class CategoryEntry:
+    id: int
+    name: str
+
+
+@dataclass(frozen=True)
+class OptionItemEntry:
+    id: int
+    name: str
+    price: float
+    image_filename: Optional[str]
+    image_variants: Optional[Dict[str, str]]
+
+
+@dataclass(frozen=True)
+class OptionGroupEntry:
+    id: int
+    name: str
+    select_type: models.SelectType
+    is_required: bool
+    items: Tuple[OptionItemEntry, ...]
+
+
+@dataclass(frozen=True)
+class ProductEntry:
+    id: int
+    name: str
+    base_price: float
+    description: Optional[str]
+    category_name: Optional[str]
+    image_filename: Optional[str]
+    image_variants: Optional[Dict[str, str]]
+    option_group_ids: Tuple[int, ...]
+
+
+@dataclass(frozen=True)
+class MenuSnapshot:
+    version: Tuple[int, int]
+    categories: Tuple[CategoryEntry, ...]
+    products: Tuple[ProductEntry, ...]
+    products_by_id: Dict[int, ProductEntry]
+    groups: Tuple[OptionGroupEntry, ...]
+
+
+def _load(db: Session, version: Tuple[int, int]) -> MenuSnapshot:
+    categories = tuple(
+        CategoryEntry(id=c.id, name=c.name)
+        for c in db.query(models.Category).order_by(models.Category.name)
+    )
+    products = tuple(
+        ProductEntry(
+            id=p.id,
+            name=p.name,
+            base_price=float(p.base_price),
+            description=p.description,
+            category_name=p.category.name if p.category else None,
+            image_filename=p.image_filename,
+            image_variants=p.image_variants,
+            option_group_ids=tuple(sorted(g.id for g in p.option_groups)),
+        )
+        for p in db.query(models.Product)
+        .options(joinedload(models.Product.category), selectinload(models.Product.option_groups))
+        .order_by(models.Product.id)
+    )
+    groups = tuple(
+        OptionGroupEntry(
+            id=g.id,
+            name=g.name,
+            select_type=g.select_type,
+            is_required=g.is_required,
+            items=tuple(
+                OptionItemEntry(
+                    id=it.id, name=it.name, price=float(it.price),
+                    image_filename=it.image_filename, image_variants=it.image_variants,
+                )
+                for it in sorted(g.items, key=lambda x: x.id)
+            ),
+        )
+        for g in db.query(models.OptionGroup)
+        .options(selectinload(models.OptionGroup.items))
+        .order_by(models.OptionGroup.id)
+    )
+    return MenuSnapshot(
+        version=version,
+        categories=categories,
+        products=products,
+        products_by_id={p.id: p for p in products},
+        groups=groups,
+    )
+
+
+class MenuCatalog:
+    def __init__(self):
+        self._snapshot: Optional[MenuSnapshot] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def version() -> Tuple[int, int]:
+        return refresher.version.get("products", 0), refresher.version.get("options", 0)
+
+    def get(self) -> MenuSnapshot:
+        snap = self._snapshot
+        if snap is not None and snap.version == self.version():
+            return snap
+        with self._lock:
+            # пока ждали замок, снимок мог собрать соседний поток
+            version = self.version()
+            snap = self._snapshot
+            if snap is None or snap.version != version:
+                db = SessionLocal()
+                try:
+                    snap = _load(db, version)
+                finally:
+                    db.close()
+                self._snapshot = snap
+            return snap
+
+
+catalog = MenuCatalog()
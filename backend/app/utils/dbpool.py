@@ -0,0 +1,73 @@
+# app/utils/dbpool.py
+"""
+Пулы соединений с замером ожидания.
+
+Ожидание свободного соединения — главный признак того, что пул мал для
+нагрузки: его и считаем (сколько раз, сколько ждали, сколько таймаутов),
+плюс текущее состояние пула. Смотреть: GET /health/db.
+"""
+import threading
+import time
+from dataclasses import dataclass, field
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+
+@dataclass
+class PoolStats:
+    checkouts: int = 0
+    timeouts: int = 0
+    wait_ms_total: float = 0.0
+    wait_ms_max: float = 0.0
+    overflow_max: int = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def observe(self, wait_ms: float, overflow: int, timed_out: bool):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_ms_total += wait_ms
+            self.wait_ms_max = max(self.wait_ms_max, wait_ms)
+            self.overflow_max = max(self.overflow_max, overflow)
+
+
+class _TimedPool:
+    # статистика на уровне класса: пересоздание пула (engine.dispose) её не сбрасывает;
+    # у каждого движка свой класс пула
+    stats: PoolStats
+
+    def _do_get(self):
+        started = time.perf_counter()
+        timed_out = False
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            self.stats.observe((time.perf_counter() - started) * 1000, max(self.overflow(), 0), timed_out)
+
+    def metrics(self) -> dict:
+        st = self.stats
+        waits = st.checkouts + st.timeouts
+        return {
+            "size": self.size(),
+            "checked_out": self.checkedout(),
+            "checked_in": self.checkedin(),
+            "overflow": max(self.overflow(), 0),
+            "overflow_max": st.overflow_max,
+            "checkouts": st.checkouts,
+            "timeouts": st.timeouts,
+            "wait_ms_avg": round(st.wait_ms_total / waits, 3) if waits else 0.0,
+            "wait_ms_max": round(st.wait_ms_max, 3),
+        }
+
+
+class TimedQueuePool(_TimedPool, QueuePool):
+    stats = PoolStats()
+
+
+class TimedAsyncQueuePool(_TimedPool, AsyncAdaptedQueuePool):
+    stats = PoolStats()
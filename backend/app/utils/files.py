@@ -1,15 +1,36 @@
 from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-import secrets, shutil, mimetypes
-from typing import Optional
-from fastapi import UploadFile
+import hashlib, os, secrets, mimetypes
+from typing import Callable, Dict, NamedTuple, Optional
+from fastapi import HTTPException, UploadFile
+from PIL import Image, ImageOps, UnidentifiedImageError
 from app.config import settings  # важно: app.config + media_dir + public_media_url
 
 MEDIA_ROOT = Path(settings.media_dir).resolve()
 MEDIA_ROOT.mkdir(parents=True, exist_ok=True)
+INCOMING = MEDIA_ROOT / ".incoming"
+INCOMING.mkdir(exist_ok=True)
+# не загрузки (SVG-иконки и т.п. с .br/.gz рядом): кладутся при деплое,
+# GC подкаталоги не обходит; имена — с версией, кэш у /media immutable
+ASSETS = MEDIA_ROOT / "assets"
+ASSETS.mkdir(exist_ok=True)
 
 _ALLOWED = {".jpg", ".jpeg", ".png", ".webp", ".gif"}
 
+# варианты картинки: длинная сторона не больше N px, всё в WebP
+VARIANTS = {"thumb": 256, "medium": 768, "full": 1600}
+_CHUNK = 1024 * 1024
+
+# декодирование и сжатие — CPU; свой ограниченный пул, Pillow при этом отпускает GIL
+_media_pool = ThreadPoolExecutor(max_workers=settings.media_workers, thread_name_prefix="media")
+
+
+class StoredImage(NamedTuple):
+    filename: str               # основной файл (full) — его пишем в image_filename
+    variants: Dict[str, str]    # thumb/medium/full -> имя файла
+
+
 def _choose_ext(file: UploadFile) -> str:
     ext = Path(file.filename or "").suffix.lower()
     if ext in _ALLOWED:
@@ -19,25 +40,89 @@ def _choose_ext(file: UploadFile) -> str:
         return guessed
     return ".jpg"
 
-def save_image(file: UploadFile) -> str:
-    if not file:
-        return ""
-    ext = _choose_ext(file)
-    name = f"{secrets.token_hex(16)}{ext}"
-    dest = MEDIA_ROOT / name
+def _too_large() -> HTTPException:
+    return HTTPException(413, detail=f"Image is larger than {settings.media_max_upload_mb} MB")
+
+def _spool(file: UploadFile, dest: Path) -> str:
+    # копируем кусками и обрываем, как только вышли за лимит; заодно считаем хэш
+    limit = int(settings.media_max_upload_mb * 1024 * 1024)
+    if file.size is not None and file.size > limit:
+        raise _too_large()
+    written = 0
+    digest = hashlib.blake2b(digest_size=16)
     with dest.open("wb") as f:
-        shutil.copyfileobj(file.file, f)
-    return name  # в БД храним только имя
+        while chunk := file.file.read(_CHUNK):
+            written += len(chunk)
+            if written > limit:
+                raise _too_large()
+            digest.update(chunk)
+            f.write(chunk)
+    return digest.hexdigest()
 
-def remove_image(filename: Optional[str]) -> None:
-    if not filename:
-        return
+def _variant_names(stem: str) -> Dict[str, str]:
+    return {name: f"{stem}_{name}.webp" for name in VARIANTS}
+
+def _make_variants(src: Path, stem: str) -> Dict[str, str]:
     try:
-        (MEDIA_ROOT / filename).unlink(missing_ok=True)
-    except Exception:
-        pass
+        with Image.open(src) as im:
+            im = ImageOps.exif_transpose(im)
+            im = im.convert("RGBA" if im.mode in ("RGBA", "LA", "P") else "RGB")
+            out = _variant_names(stem)
+            for name, side in VARIANTS.items():
+                v = im.copy()
+                v.thumbnail((side, side), Image.LANCZOS)
+                # пишем во временный файл и атомарно подменяем: одинаковую картинку
+                # могут грузить параллельно, а читатель не должен увидеть половину файла
+                tmp = INCOMING / f"{out[name]}.{secrets.token_hex(4)}.tmp"
+                try:
+                    v.save(tmp, "WEBP", quality=settings.media_webp_quality, method=4)
+                    os.replace(tmp, MEDIA_ROOT / out[name])
+                finally:
+                    tmp.unlink(missing_ok=True)
+            return out
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError):
+        raise HTTPException(400, detail="Unsupported or broken image")
+
+def _reuse(variants: Dict[str, str]) -> bool:
+    """Все варианты уже на диске — освежаем mtime, чтобы GC не снёс их до commit."""
+    try:
+        for fname in variants.values():
+            os.utime(MEDIA_ROOT / fname)
+        return True
+    except FileNotFoundError:
+        return False
+
+def save_image(file: UploadFile) -> Optional[StoredImage]:
+    """
+    Загрузка → временный файл → WebP-варианты (VARIANTS). Оригинал не хранится.
+    Имена — хэш содержимого: повторная загрузка той же картинки файлы не пишет.
+    Файлы не удаляются при правках — лишнее убирает GC (utils/media_gc).
+    Вызывать из обычных (def) хэндлеров: они уже в threadpool, не на event loop.
+    """
+    if not file:
+        return None
+    tmp = INCOMING / f"{secrets.token_hex(16)}{_choose_ext(file)}.part"
+    try:
+        stem = _spool(file, tmp)
+        variants = _variant_names(stem)
+        if not _reuse(variants):
+            variants = _media_pool.submit(_make_variants, tmp, stem).result()
+    finally:
+        tmp.unlink(missing_ok=True)
+    return StoredImage(variants["full"], variants)
+
+def set_image(obj, stored: Optional[StoredImage]) -> None:
+    # obj — Product или OptionItem
+    obj.image_filename = stored.filename if stored else None
+    obj.image_variants = stored.variants if stored else None
 
 def media_url(filename: Optional[str]) -> Optional[str]:
     if not filename:
         return None
     return f"{str(settings.public_media_url).rstrip('/')}/{filename.lstrip('/')}"
+
+def media_urls(url: Callable[[Optional[str]], Optional[str]], variants: Optional[Dict[str, str]]) -> Optional[Dict[str, str]]:
+    # thumb/medium/full; для картинок, загруженных до WebP-вариантов, — None
+    if not variants:
+        return None
+    return {name: url(fname) for name, fname in variants.items()}
@@ -0,0 +1,42 @@
+# app/utils/http_cache.py
+"""
+ETag / If-None-Match для редко меняющихся JSON-ответов (меню).
+
+ETag — хэш содержимого, поэтому он одинаков на всех воркерах и узлах.
+Тело и хэш кэшируются по версии данных: повторный запрос той же версии
+не кодирует ответ заново, а совпавший If-None-Match получает пустой 304.
+"""
+import hashlib
+from typing import Any, Callable, Hashable, Tuple
+from fastapi import Request, Response
+
+from ..config import settings
+from .cache import VersionedCache
+from .jsonenc import dumps
+
+# версия данных — основной ключ; TTL лишь страхует от бесконечного хранения
+_bodies = VersionedCache(ttl=3600)
+
+
+def _encode(payload: Any) -> Tuple[bytes, str]:
+    body = dumps(payload)
+    return body, '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def _matches(header: str | None, etag: str) -> bool:
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # If-None-Match сравнивается «слабо»: W/"x" совпадает с "x"
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+def etag_json(request: Request, version: Hashable, build: Callable[[], Any]) -> Response:
+    # абсолютные URL картинок зависят от хоста — он часть имени записи
+    name = f"{request.url.path}|{request.base_url}"
+    body, etag = _bodies.get(name, version, lambda: _encode(build()))
+    headers = {"ETag": etag, "Cache-Control": settings.menu_cache_control}
+    if _matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
@@ -0,0 +1,42 @@
+# app/utils/jsonenc.py
+from decimal import Decimal
+from typing import Any, Iterable, Iterator
+import orjson
+from pydantic import BaseModel
+
+
+def _default(obj: Any):
+    # datetime/enum/dataclass orjson понимает сам; остальное — здесь
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(obj: Any) -> bytes:
+    return orjson.dumps(obj, default=_default)
+
+
+def dumps_text(obj: Any) -> str:
+    # websocket-кадры у нас текстовые: декодируем один раз на сообщение
+    return dumps(obj).decode()
+
+
+def iter_json_object(head: dict, sections: dict[str, Iterable[Any]]) -> Iterator[bytes]:
+    """
+    JSON-объект по кускам: сначала поля head, затем массивы sections,
+    элементы которых кодируются по одному — без сборки всего ответа в памяти.
+    """
+    body = dumps(head)[1:-1]
+    yield b"{" + body
+    sep = b"," if body else b""
+    for name, rows in sections.items():
+        yield sep + dumps(name) + b":["
+        sep = b","
+        first = True
+        for row in rows:
+            yield (b"" if first else b",") + dumps(row)
+            first = False
+        yield b"]"
+    yield b"}"
@@ -0,0 +1,115 @@
+# app/utils/media_gc.py
+"""
+Сборка мусора в media_dir (mark-and-sweep).
+
+Хэндлеры файлы картинок не удаляют: при хранении по хэшу один файл может
+принадлежать нескольким товарам/опциям, а удаление до commit оставляло
+битые ссылки при откате. Здесь периодически:
+  mark  — имена из products/option_items (image_filename и image_variants);
+  sweep — всё прочее в media_dir и .incoming, что старше grace-периода
+          (предсжатые .br/.gz живут, пока живёт их исходный файл).
+Обходятся только файлы верхнего уровня: подкаталоги (assets/ — статика
+не из загрузок) GC не трогает.
+Grace защищает файлы, загруженные, но ещё не закоммиченные; mtime
+перепроверяется прямо перед удалением (_reuse мог освежить файл после обхода).
+Предохранители: если ссылок нет вовсе — это скорее пустая/чужая БД, чем мусор,
+и media_dir не чистим; за один проход удаляем не больше половины media_dir
+(самые старые) — большой хвост после замены фото уходит за несколько проходов,
+а ошибка в mark не стирает всё разом.
+"""
+import asyncio
+import logging
+import time
+from typing import Set, Tuple
+from sqlalchemy.orm import Session
+
+from .. import models
+from ..config import settings
+from ..database import SessionLocal
+from .files import INCOMING, MEDIA_ROOT
+from .media_static import PRECOMPRESSED
+
+log = logging.getLogger(__name__)
+
+# доля файлов media_dir, больше которой за один проход не удаляем (остальное — в следующий)
+_MAX_SWEEP_SHARE = 0.5
+
+
+def _referenced(db: Session) -> Set[str]:
+    names: Set[str] = set()
+    for model in (models.Product, models.OptionItem):
+        for fname, variants in db.query(model.image_filename, model.image_variants):
+            if fname:
+                names.add(fname)
+            if variants:
+                names.update(variants.values())
+    return names
+
+
+def _owner(name: str) -> str:
+    for _, ext in PRECOMPRESSED:
+        if name.endswith(ext):
+            return name[: -len(ext)]
+    return name
+
+
+def collect(db: Session, grace_seconds: float) -> Tuple[int, int]:
+    """Удалить неиспользуемые файлы старше grace_seconds. Возвращает (файлов, байт)."""
+    cutoff = time.time() - grace_seconds
+    # сначала список файлов, потом ссылки: файл, появившийся после обхода,
+    # в этот проход не попадает вовсе
+    media = [path for path in MEDIA_ROOT.iterdir() if path.is_file()]
+    candidates = [
+        (path, mtime)
+        for path in media + [p for p in INCOMING.iterdir() if p.is_file()]
+        if (mtime := path.stat().st_mtime) < cutoff
+    ]
+    keep = _referenced(db)
+    incoming = [p for p, _ in candidates if p.parent != MEDIA_ROOT]
+    swept = sorted(
+        (c for c in candidates if c[0].parent == MEDIA_ROOT and _owner(c[0].name) not in keep),
+        key=lambda c: c[1],
+    )
+    if swept and not keep:
+        log.warning("media gc: no referenced images, %d files in %s left untouched", len(swept), MEDIA_ROOT)
+        swept = []
+    limit = max(int(len(media) * _MAX_SWEEP_SHARE), 1)
+    if len(swept) > limit:
+        log.warning("media gc: %d unreferenced files in %s, removing the oldest %d", len(swept), MEDIA_ROOT, limit)
+        swept = swept[:limit]
+    doomed = incoming + [p for p, _ in swept]
+    removed = freed = 0
+    for path in doomed:
+        try:
+            st = path.stat()
+            # файл могли переиспользовать (touch) уже после обхода
+            if st.st_mtime >= cutoff:
+                continue
+            path.unlink()
+        except FileNotFoundError:
+            continue
+        except OSError:
+            log.warning("media gc: cannot remove %s", path)
+            continue
+        removed += 1
+        freed += st.st_size
+    return removed, freed
+
+
+def _run_once() -> Tuple[int, int]:
+    db = SessionLocal()
+    try:
+        return collect(db, settings.media_gc_grace_minutes * 60)
+    finally:
+        db.close()
+
+
+async def collect_forever() -> None:
+    while True:
+        try:
+            removed, freed = await asyncio.to_thread(_run_once)
+            if removed:
+                log.info("media gc: removed %d files, %.1f MB", removed, freed / 1024 / 1024)
+        except Exception:
+            log.exception("media gc failed")
+        await asyncio.sleep(settings.media_gc_interval_minutes * 60)
@@ -0,0 +1,80 @@
+# app/utils/media_static.py
+"""
+Раздача /media.
+
+Имена файлов никогда не переиспользуются (хэш содержимого, у старых —
+случайные), поэтому ответ кэшируется «навсегда» (MEDIA_CACHE_CONTROL,
+по умолчанию immutable): сетка меню после первого визита грузится из кэша
+браузера без перепроверок. ETag — имя файла, одинаковый на всех узлах.
+Если рядом лежит предсжатый вариант (<файл>.br / <файл>.gz) и клиент его
+принимает — отдаём его. Предсжатые файлы — для media/assets (files.ASSETS):
+загрузки уже WebP, а верхний уровень media_dir чистит GC. Range и If-None-Match/If-Modified-Since
+обрабатывают FileResponse и StaticFiles.
+"""
+import os
+from mimetypes import guess_type
+from pathlib import PurePath
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+from ..config import settings
+
+# в порядке предпочтения
+PRECOMPRESSED = (("br", ".br"), ("gzip", ".gz"))
+
+
+def _accepted_encodings(header: str) -> set[str]:
+    out = set()
+    for part in header.split(","):
+        token, _, params = part.partition(";")
+        params = params.strip().replace(" ", "")
+        if params.startswith("q="):
+            try:
+                if float(params[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        out.add(token.strip().lower())
+    return out
+
+
+class MediaFiles(StaticFiles):
+    async def get_response(self, path: str, scope) -> Response:
+        # .incoming и прочие служебные каталоги наружу не отдаём
+        if any(part.startswith(".") for part in PurePath(path).parts):
+            raise HTTPException(status_code=404)
+        return await super().get_response(path, scope)
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope, status_code: int = 200) -> Response:
+        request_headers = Headers(scope=scope)
+        accepted = _accepted_encodings(request_headers.get("accept-encoding", ""))
+        name = os.path.basename(full_path)
+
+        response, etag = None, name
+        for encoding, ext in PRECOMPRESSED:
+            if encoding not in accepted:
+                continue
+            try:
+                st = os.stat(f"{full_path}{ext}")
+            except OSError:
+                continue
+            response = FileResponse(
+                f"{full_path}{ext}",
+                status_code=status_code,
+                stat_result=st,
+                media_type=guess_type(name)[0] or "application/octet-stream",
+            )
+            response.headers["content-encoding"] = encoding
+            etag = f"{name}-{encoding}"
+            break
+        if response is None:
+            response = FileResponse(full_path, status_code=status_code, stat_result=stat_result)
+
+        response.headers["etag"] = f'"{etag}"'
+        response.headers["cache-control"] = settings.media_cache_control
+        response.headers["vary"] = "Accept-Encoding"
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
@@ -0,0 +1,168 @@
+# app/utils/pubsub.py
+"""
+Транспорт событий реального времени между процессами.
+
+memory   — всё внутри одного процесса (по умолчанию, один воркер uvicorn);
+postgres — LISTEN/NOTIFY в той же БД: событие, опубликованное любым воркером
+           или контейнером, получают все, включая отправителя. После каждого
+           (пере)подключения LISTEN получатель получает {"kind": "reset"}:
+           что пришло в разрыве, неизвестно, кэши надо сбросить.
+"""
+import asyncio
+import json
+import logging
+from typing import Callable, Optional
+
+from ..config import settings
+from .jsonenc import dumps_text
+
+log = logging.getLogger(__name__)
+
+Handler = Callable[[dict], None]
+
+# NOTIFY принимает payload не длиннее 8000 байт
+_PG_PAYLOAD_LIMIT = 7999
+
+
+class MemoryBackend:
+    def __init__(self):
+        self.on_message: Optional[Handler] = None
+
+    def bind(self, on_message: Handler) -> None:
+        self.on_message = on_message
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    def publish(self, message: dict) -> None:
+        if self.on_message:
+            self.on_message(message)
+
+
+class PostgresBackend:
+    def __init__(self, channel: str, reconnect_delay: float = 2.0):
+        self.channel = channel
+        self.reconnect_delay = reconnect_delay
+        self.on_message: Optional[Handler] = None
+        self._outbox: asyncio.Queue[str] | None = None
+        self._tasks: list[asyncio.Task] = []
+
+    def bind(self, on_message: Handler) -> None:
+        self.on_message = on_message
+
+    @staticmethod
+    def _connect():
+        import psycopg2
+        from ..database import url
+
+        conn = psycopg2.connect(**url.translate_connect_args(username="user", database="dbname"))
+        conn.autocommit = True
+        return conn
+
+    async def start(self) -> None:
+        self._outbox = asyncio.Queue()
+        self._tasks = [
+            asyncio.create_task(self._listen_forever()),
+            asyncio.create_task(self._publish_forever()),
+        ]
+
+    async def stop(self) -> None:
+        for t in self._tasks:
+            t.cancel()
+        self._tasks = []
+
+    def publish(self, message: dict) -> None:
+        if self._outbox is None:
+            # до старта (или в скриптах) — хотя бы локальная доставка
+            if self.on_message:
+                self.on_message(message)
+            return
+        data = dumps_text(message)
+        size = len(data.encode())
+        if size > _PG_PAYLOAD_LIMIT:
+            if message.get("kind") != "event":
+                log.error("pubsub message too large for NOTIFY (%d bytes), dropped", size)
+                return
+            # событие не влезло: вместо него — mark канала, все получат полный снимок
+            log.warning(
+                "pubsub event on %r too large for NOTIFY (%d bytes), sending a full refresh",
+                message["channel"], size,
+            )
+            data = dumps_text({"kind": "mark", "channels": [message["channel"]]})
+        self._outbox.put_nowait(data)
+
+    async def _publish_forever(self):
+        # один писатель — порядок NOTIFY совпадает с порядком publish()
+        conn = None
+        while True:
+            data = await self._outbox.get()
+            while True:
+                try:
+                    if conn is None or conn.closed:
+                        conn = await asyncio.to_thread(self._connect)
+                    await asyncio.to_thread(self._notify, conn, data)
+                    break
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    log.exception("pubsub NOTIFY failed, retrying")
+                    conn = None
+                    await asyncio.sleep(self.reconnect_delay)
+
+    def _notify(self, conn, data: str):
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_notify(%s, %s)", (self.channel, data))
+
+    async def _listen_forever(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            conn = None
+            try:
+                conn = await asyncio.to_thread(self._connect)
+                with conn.cursor() as cur:
+                    cur.execute(f'LISTEN "{self.channel}"')
+                broken = loop.create_future()
+
+                def _on_readable():
+                    try:
+                        conn.poll()
+                    except Exception as e:
+                        if not broken.done():
+                            broken.set_exception(e)
+                        return
+                    while conn.notifies:
+                        self._dispatch(conn.notifies.pop(0).payload)
+
+                loop.add_reader(conn.fileno(), _on_readable)
+                # пока не слушали, NOTIFY могли пропасть: пусть получатель всё перечитает
+                if self.on_message:
+                    self.on_message({"kind": "reset"})
+                try:
+                    await broken
+                finally:
+                    loop.remove_reader(conn.fileno())
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("pubsub LISTEN connection lost, reconnecting")
+            finally:
+                if conn is not None and not conn.closed:
+                    conn.close()
+            await asyncio.sleep(self.reconnect_delay)
+
+    def _dispatch(self, payload: str):
+        try:
+            message = json.loads(payload)
+            if self.on_message:
+                self.on_message(message)
+        except Exception:
+            log.exception("bad pubsub message: %.200s", payload)
+
+
+def make_backend():
+    if settings.pubsub_backend == "postgres":
+        return PostgresBackend(settings.pubsub_channel)
+    return MemoryBackend()
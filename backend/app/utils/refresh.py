@@ -0,0 +1,179 @@
+# app/utils/refresh.py
+import asyncio
+import inspect
+import logging
+from typing import Awaitable, Callable, Dict, List, Set, Tuple, Union
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from ..config import settings
+from ..database import AsyncSessionLocal, SessionLocal
+from .broadcast import hub
+from .jsonenc import dumps_text
+from .pubsub import make_backend
+
+log = logging.getLogger(__name__)
+
+# синхронный сборщик получает Session и выполняется в потоке,
+# асинхронный — AsyncSession и выполняется прямо на loop
+Builder = Union[Callable[[Session], dict], Callable[[AsyncSession], Awaitable[dict]]]
+
+
+class RefreshScheduler:
+    """
+    Фоновая пересборка снимков каналов.
+    Хэндлеры только помечают канал «грязным» (mark); все пометки внутри окна
+    склеиваются, и каждый снимок строится один раз за окно — уже после того,
+    как HTTP-ответ ушёл клиенту.
+    Для дельта-каналов хэндлеры кладут события (emit): они уходят в том же
+    окне, по порядку, с монотонным номером seq на канал.
+    mark/emit идут через pubsub-бэкенд, поэтому их видят все воркеры;
+    seq каждый процесс нумерует сам для своих подключений — в момент прихода
+    события, вместе с версией канала: снимок, начатый до события, несёт
+    меньший seq, а начатый после — уже содержит событие.
+    Снимок канала кодируется в JSON один раз и кэшируется до следующей
+    мутации (version): этот же текст получают все подписчики и новые подключения.
+    """
+
+    def __init__(self, window_ms: int, backend=None):
+        self.window = max(window_ms, 0) / 1000
+        self.builders: Dict[str, Builder] = {}
+        self.dirty: Set[str] = set()
+        self.events: Dict[str, List[dict]] = {}
+        self.seq: Dict[str, int] = {}
+        self.version: Dict[str, int] = {}
+        self.frames: Dict[str, str] = {}
+        self._building: Dict[Tuple[str, int], asyncio.Future] = {}
+        self._task: asyncio.Task | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self.backend = backend or make_backend()
+        self.backend.bind(self._on_message)
+
+    async def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        await self.backend.start()
+
+    async def stop(self) -> None:
+        await self.backend.stop()
+
+    def register(self, channel: str, builder: Builder) -> None:
+        self.builders[channel] = builder
+
+    def mark(self, *channels: str) -> None:
+        # версию поднимаем и локально сразу: свой воркер видит изменение
+        # без ожидания эха от pubsub (повторный bump безвреден)
+        for channel in channels:
+            self._invalidate(channel)
+        self._publish({"kind": "mark", "channels": list(channels)})
+
+    def emit(self, channel: str, event: dict) -> None:
+        self._publish({"kind": "event", "channel": channel, "event": event})
+
+    def _publish(self, message: dict) -> None:
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if self._loop is None or running is self._loop:
+            self.backend.publish(message)
+        else:
+            # вызов из threadpool-хэндлера (def): бэкенд и планировщик живут на loop
+            self._loop.call_soon_threadsafe(self.backend.publish, message)
+
+    def _on_message(self, message: dict) -> None:
+        kind = message.get("kind")
+        if kind == "mark":
+            channels = message.get("channels") or []
+            self.dirty.update(channels)
+        elif kind == "event":
+            channel = message["channel"]
+            channels = [channel]
+            # seq растёт даже без подписчиков — иначе клиент не заметит пропуск
+            self.seq[channel] = self.current_seq(channel) + 1
+            self.events.setdefault(channel, []).append({**message["event"], "seq": self.seq[channel]})
+        elif kind == "reset":
+            # pubsub переподключился, события из разрыва потеряны: сбрасываем все
+            # кэши (и principals — "users") и рассылаем свежие снимки со своим seq
+            channels = list(set(self.builders) | set(self.version) | {"users"})
+            self.dirty.update(self.builders)
+        else:
+            return
+        for channel in channels:
+            self._invalidate(channel)
+        self._wake()
+
+    def _invalidate(self, channel: str):
+        self.version[channel] = self.version.get(channel, 0) + 1
+        self.frames.pop(channel, None)
+
+    def current_seq(self, channel: str) -> int:
+        return self.seq.get(channel, 0)
+
+    async def snapshot(self, channel: str) -> str:
+        """Закодированный полный снимок канала (для join/resync) с текущим seq."""
+        frame = self.frames.get(channel)
+        if frame is not None:
+            return frame
+        # одна сборка на версию канала: сотня экранов, переподключившихся разом,
+        # ждёт один и тот же результат и занимает одно соединение из пула
+        key = (channel, self.version.get(channel, 0))
+        build = self._building.get(key)
+        if build is None:
+            build = asyncio.ensure_future(self._build(self.builders[channel], self.current_seq(channel)))
+            self._building[key] = build
+            build.add_done_callback(lambda _f: self._building.pop(key, None))
+        # shield: отвалившийся клиент не отменяет сборку для остальных
+        frame = await asyncio.shield(build)
+        # пока строили, могла прийти мутация — такой снимок не кэшируем
+        if self.version.get(channel, 0) == key[1]:
+            self.frames[channel] = frame
+        return frame
+
+    def _wake(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while self.dirty or self.events:
+            await asyncio.sleep(self.window)
+            events, self.events = self.events, {}
+            for channel, batch in events.items():
+                await self._send_events(channel, batch)
+            channels, self.dirty = self.dirty, set()
+            for channel in channels:
+                await self._flush(channel)
+
+    async def _send_events(self, channel: str, batch: List[dict]):
+        for event in batch:
+            try:
+                await hub.send(channel, event)
+            except Exception:
+                log.exception("event delivery on channel %r failed", channel)
+
+    async def _flush(self, channel: str):
+        builder = self.builders.get(channel)
+        # некому слать — не трогаем БД (снимок построится при первом join)
+        if builder is None or not hub.channels.get(channel):
+            return
+        try:
+            hub.send_encoded(channel, await self.snapshot(channel))
+        except Exception:
+            log.exception("refresh of channel %r failed", channel)
+
+    @classmethod
+    async def _build(cls, builder: Builder, seq: int) -> str:
+        # своя короткая сессия: сессия запроса к этому моменту уже закрыта
+        if inspect.iscoroutinefunction(builder):
+            async with AsyncSessionLocal() as db:
+                return dumps_text({**await builder(db), "seq": seq})
+        return await asyncio.to_thread(cls._build_sync, builder, seq)
+
+    @staticmethod
+    def _build_sync(builder: Builder, seq: int) -> str:
+        db = SessionLocal()
+        try:
+            return dumps_text({**builder(db), "seq": seq})
+        finally:
+            db.close()
+
+
+refresher = RefreshScheduler(settings.broadcast_window_ms)
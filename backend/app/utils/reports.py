@@ -0,0 +1,120 @@
+# app/utils/reports.py
+"""
+Отчёт о продажах за период: всё агрегируется в SQL, строки отдаются потоком.
+
+Ряды по времени берутся из sales_hourly/sales_daily (см. utils/rollup),
+разбивка по товарам и категориям — GROUP BY по order_items (вместе с архивом)
+за UTC-диапазон.
+"""
+from datetime import date
+from typing import Iterator, Literal
+from sqlalchemy import Date, cast, desc, func, select, union_all
+from sqlalchemy.orm import Session
+
+from .. import models
+from .timerange import day_range, in_range
+
+Granularity = Literal["hour", "day", "week", "month"]
+
+NO_CATEGORY = "Без категории"
+_YIELD_PER = 500
+
+
+def _stream(db: Session, stmt) -> Iterator[dict]:
+    result = db.execute(stmt.execution_options(yield_per=_YIELD_PER))
+    for row in result.mappings():
+        yield dict(row)
+
+
+def _metrics(t):
+    return (
+        func.sum(t.orders).label("orders"),
+        func.sum(t.revenue).label("revenue"),
+        func.sum(t.take_away_orders).label("take_away_orders"),
+        func.sum(t.take_away_revenue).label("take_away_revenue"),
+        func.sum(t.closed_orders).label("closed_orders"),
+    )
+
+
+def series(db: Session, date_from: date, date_to: date, granularity: Granularity) -> Iterator[dict]:
+    if granularity == "hour":
+        h = models.SalesHourly
+        stmt = (
+            select(h.day, h.hour, *_metrics(h))
+            .where(h.day >= date_from, h.day <= date_to)
+            .group_by(h.day, h.hour)
+            .order_by(h.day, h.hour)
+        )
+        for row in _stream(db, stmt):
+            row["bucket"] = f"{row.pop('day').isoformat()}T{row.pop('hour'):02d}:00"
+            yield row
+        return
+
+    d = models.SalesDaily
+    bucket = d.day if granularity == "day" else cast(func.date_trunc(granularity, d.day), Date)
+    stmt = (
+        select(bucket.label("bucket"), *_metrics(d))
+        .where(d.day >= date_from, d.day <= date_to)
+        .group_by(bucket)
+        .order_by(bucket)
+    )
+    yield from _stream(db, stmt)
+
+
+def _lines(date_from: date, date_to: date):
+    """Позиции «горячих» и архивных заказов за период одним набором строк."""
+    rng = (day_range(date_from)[0], day_range(date_to)[1])
+    parts = [
+        select(it.product_id, it.name_snapshot, it.unit_price, it.qty)
+        .join(o, o.id == it.order_id)
+        .where(in_range(o.created_at, rng))
+        for o, it in (
+            (models.Order, models.OrderItem),
+            (models.OrderArchive, models.OrderItemArchive),
+        )
+    ]
+    return union_all(*parts).subquery("lines")
+
+
+def _with_catalog(stmt, lines):
+    return (
+        stmt.select_from(lines)
+        .outerjoin(models.Product, models.Product.id == lines.c.product_id)
+        .outerjoin(models.Category, models.Category.id == models.Product.category_id)
+    )
+
+
+def _category():
+    return func.coalesce(models.Category.name, NO_CATEGORY).label("category")
+
+
+def _item_totals(lines):
+    return (
+        func.sum(lines.c.qty).label("qty"),
+        func.sum(lines.c.unit_price * lines.c.qty).label("revenue"),
+    )
+
+
+def by_product(db: Session, date_from: date, date_to: date) -> Iterator[dict]:
+    lines = _lines(date_from, date_to)
+    category = _category()
+    qty, revenue = _item_totals(lines)
+    stmt = _with_catalog(select(
+        lines.c.product_id,
+        # удалённый товар — по имени из снимка позиции
+        func.coalesce(models.Product.name, func.min(lines.c.name_snapshot)).label("name"),
+        category,
+        qty,
+        revenue,
+    ), lines)
+    stmt = stmt.group_by(lines.c.product_id, models.Product.name, category).order_by(desc(revenue))
+    yield from _stream(db, stmt)
+
+
+def by_category(db: Session, date_from: date, date_to: date) -> Iterator[dict]:
+    lines = _lines(date_from, date_to)
+    category = _category()
+    qty, revenue = _item_totals(lines)
+    stmt = _with_catalog(select(category, qty, revenue), lines)
+    stmt = stmt.group_by(category).order_by(desc(revenue))
+    yield from _stream(db, stmt)
@@ -0,0 +1,111 @@
+# app/utils/rollup.py
+"""
+Ведение sales_hourly / sales_daily.
+
+record_* вызываются внутри транзакции заказа (до commit): агрегаты и заказ
+фиксируются или откатываются вместе. backfill пересчитывает агрегаты
+из таблицы orders (команда: python -m app.backfill_rollups).
+"""
+from datetime import datetime
+from sqlalchemy import Integer, cast, extract, func, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from .. import models
+from .timerange import KZ_TZ, LOCAL_TZ
+
+
+def _bump(db: Session, model, keys: dict, deltas: dict) -> None:
+    stmt = pg_insert(model).values(**keys, **deltas)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(keys),
+        set_={k: getattr(model, k) + stmt.excluded[k] for k in deltas},
+    )
+    db.execute(stmt)
+
+
+def _bump_both(db: Session, day, hour, deltas: dict) -> None:
+    _bump(db, models.SalesHourly, {"day": day, "hour": hour}, deltas)
+    _bump(db, models.SalesDaily, {"day": day}, deltas)
+
+
+def record_order_created(db: Session, total: float, take_away: bool) -> None:
+    # now() — время начала транзакции, то же, что уйдёт в orders.created_at
+    local_now = func.timezone(KZ_TZ, func.now())
+    _bump_both(db, func.date(local_now), cast(extract("hour", local_now), Integer), {
+        "orders": 1,
+        "revenue": total,
+        "take_away_orders": 1 if take_away else 0,
+        "take_away_revenue": total if take_away else 0,
+    })
+
+
+def record_order_closed(db: Session, closed_at: datetime) -> None:
+    local = closed_at.astimezone(LOCAL_TZ)
+    _bump_both(db, local.date(), local.hour, {"closed_orders": 1})
+
+
+# архив — тоже продажи: после «очистить закрытые» заказы живут только там
+_ALL_ORDERS = """(
+        SELECT created_at, closed_at, total, take_away FROM orders
+        UNION ALL
+        SELECT created_at, closed_at, total, take_away FROM orders_archive
+    ) AS o"""
+
+_BACKFILL_SQL = [
+    # созданные заказы по часу создания
+    """
+    INSERT INTO sales_hourly (day, hour, orders, revenue, take_away_orders, take_away_revenue)
+    SELECT date(timezone(:tz, created_at)),
+           extract(hour FROM timezone(:tz, created_at))::int,
+           count(*),
+           coalesce(sum(total), 0),
+           count(*) FILTER (WHERE take_away),
+           coalesce(sum(total) FILTER (WHERE take_away), 0)
+    FROM """ + _ALL_ORDERS + """
+    GROUP BY 1, 2
+    ON CONFLICT (day, hour) DO UPDATE SET
+        orders = EXCLUDED.orders,
+        revenue = EXCLUDED.revenue,
+        take_away_orders = EXCLUDED.take_away_orders,
+        take_away_revenue = EXCLUDED.take_away_revenue
+    """,
+    # закрытия по часу закрытия
+    """
+    INSERT INTO sales_hourly (day, hour, closed_orders)
+    SELECT date(timezone(:tz, closed_at)),
+           extract(hour FROM timezone(:tz, closed_at))::int,
+           count(*)
+    FROM """ + _ALL_ORDERS + """
+    WHERE closed_at IS NOT NULL
+    GROUP BY 1, 2
+    ON CONFLICT (day, hour) DO UPDATE SET closed_orders = EXCLUDED.closed_orders
+    """,
+    # дни — свёртка часов
+    """
+    INSERT INTO sales_daily (day, orders, revenue, take_away_orders, take_away_revenue, closed_orders)
+    SELECT day, sum(orders), sum(revenue), sum(take_away_orders), sum(take_away_revenue), sum(closed_orders)
+    FROM sales_hourly
+    GROUP BY day
+    ON CONFLICT (day) DO UPDATE SET
+        orders = EXCLUDED.orders,
+        revenue = EXCLUDED.revenue,
+        take_away_orders = EXCLUDED.take_away_orders,
+        take_away_revenue = EXCLUDED.take_away_revenue,
+        closed_orders = EXCLUDED.closed_orders
+    """,
+]
+
+
+def backfill(db: Session) -> None:
+    """
+    Пересчитать агрегаты по часам/дням, в которых есть строки orders.
+    Часы, заказы которых уже удалены, не трогаются — история в агрегатах остаётся.
+    """
+    for sql in _BACKFILL_SQL:
+        db.execute(text(sql), {"tz": KZ_TZ})
+    db.commit()
+
+
+def is_empty(db: Session) -> bool:
+    return db.query(models.SalesDaily.day).first() is None
@@ -1,3 +1,7 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
 from jose import jwt, JWTError
 from passlib.context import CryptContext
@@ -6,8 +10,10 @@ from sqlalchemy.orm import Session
 from ..config import settings
 from ..database import get_db
 from .. import models
+from .cache import LRUCache
+from .refresh import refresher
 
-pwd_ctx = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_ctx = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.bcrypt_rounds)
 ALGO = "HS256"
 COOKIE_NAME = "access_token"
 
@@ -17,6 +23,16 @@ def hash_password(p: str) -> str:
 def verify_password(p: str, h: str) -> bool:
     return pwd_ctx.verify(p, h)
 
+# bcrypt — сотни мс CPU на вызов; свой ограниченный пул: волна логинов
+# в пересменку ждёт в его очереди и не занимает loop и общий threadpool
+_hash_pool = ThreadPoolExecutor(max_workers=settings.password_hash_workers, thread_name_prefix="bcrypt")
+
+async def hash_password_async(p: str) -> str:
+    return await asyncio.get_running_loop().run_in_executor(_hash_pool, hash_password, p)
+
+async def verify_password_async(p: str, h: str) -> bool:
+    return await asyncio.get_running_loop().run_in_executor(_hash_pool, verify_password, p, h)
+
 def create_access_token(sub: str, expires_minutes: int | None = None) -> str:
     expire = datetime.now(timezone.utc) + timedelta(
         minutes=expires_minutes or settings.ACCESS_TOKEN_EXPIRE_MINUTES
@@ -50,12 +66,35 @@ def _extract_token(request: Request, bearer: str | None) -> str:
         return cookie
     raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
 
+@dataclass(frozen=True)
+class Principal:
+    """Текущий пользователь без привязки к сессии — его можно кэшировать."""
+    id: int
+    name: str
+    phone: str
+    role: models.Role
+
+# token -> (версия users, Principal); проверка подписи и SELECT — один раз на токен
+_principals = LRUCache(settings.auth_cache_size)
+
+def _users_version() -> int:
+    return refresher.version.get("users", 0)
+
+def invalidate_users() -> None:
+    # версия users растёт на всех воркерах — кэшированные принципалы устаревают
+    refresher.mark("users")
+
 def get_current_user(
     request: Request,
     db: Session = Depends(get_db),
     bearer: str | None = Depends(_get_bearer),
-) -> models.User:
+) -> Principal:
     token = _extract_token(request, bearer)
+    # версию берём до запроса: правка пользователя во время чтения не закэшируется
+    version = _users_version()
+    hit = _principals.get(token)
+    if hit is not None and hit[0] == version:
+        return hit[1]
     try:
         payload = jwt.decode(token, settings.secret_key, algorithms=[ALGO])
         phone: str | None = payload.get("sub")
@@ -66,9 +105,15 @@ def get_current_user(
     user = db.query(models.User).filter(models.User.phone == phone).first()
     if not user:
         raise HTTPException(status_code=401, detail="User not found")
-    return user
+    principal = Principal(id=user.id, name=user.name, phone=user.phone, role=user.role)
+    # не дольше, чем живёт сам токен
+    ttl = settings.auth_cache_ttl
+    if payload.get("exp"):
+        ttl = min(ttl, payload["exp"] - time.time())
+    _principals.put(token, (version, principal), ttl)
+    return principal
 
-def require_admin(user: models.User = Depends(get_current_user)) -> models.User:
+def require_admin(user: Principal = Depends(get_current_user)) -> Principal:
     if user.role != models.Role.admin:
         raise HTTPException(status_code=403, detail="Admins only")
     return user
@@ -2,7 +2,7 @@ from pathlib import Path
 from fastapi import UploadFile
 from ..config import settings
 import secrets
-from app.utils.files import save_image, remove_image, media_url
+from app.utils.files import save_image, media_url
 MEDIA_ROOT = Path(settings.MEDIA_DIR)
 MEDIA_ROOT.mkdir(parents=True, exist_ok=True)
 
@@ -0,0 +1,49 @@
+# app/utils/timerange.py
+"""
+Локальные периоды кофейни (Asia/Almaty) -> полуоткрытые UTC-диапазоны [start, end).
+
+Фильтр вида `col >= start AND col < end` идёт по обычному индексу на колонке,
+в отличие от date(timezone(tz, col)) = ..., который индексом не покрывается.
+"""
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Optional, Tuple
+from zoneinfo import ZoneInfo
+from sqlalchemy import and_
+
+KZ_TZ = "Asia/Almaty"
+LOCAL_TZ = ZoneInfo(KZ_TZ)
+
+Range = Tuple[datetime, datetime]
+
+
+def local_now() -> datetime:
+    return datetime.now(LOCAL_TZ)
+
+
+def local_today() -> date:
+    return local_now().date()
+
+
+def _utc_midnight(day: date) -> datetime:
+    return datetime.combine(day, time.min, tzinfo=LOCAL_TZ).astimezone(timezone.utc)
+
+
+def day_range(day: Optional[date] = None) -> Range:
+    day = day or local_today()
+    return _utc_midnight(day), _utc_midnight(day + timedelta(days=1))
+
+
+def month_days(day: Optional[date] = None) -> Tuple[date, date]:
+    """Первый день месяца и первый день следующего (локальные даты)."""
+    first = (day or local_today()).replace(day=1)
+    return first, (first + timedelta(days=32)).replace(day=1)
+
+
+def month_range(day: Optional[date] = None) -> Range:
+    first, nxt = month_days(day)
+    return _utc_midnight(first), _utc_midnight(nxt)
+
+
+def in_range(col, rng: Range):
+    start, end = rng
+    return and_(col >= start, col < end)
@@ -0,0 +1,65 @@
+# tests/test_catalog_queries.py
+"""
+Меню: сборка каталога — запрос на уровень (категории, товары, группы товаров,
+группы, опции), а не на строку; чтения из снимка — без SQL. selectinload шлёт
+IN-списки пачками по 500 (SelectInLoader._chunksize): ceil(строк / 500) на уровень.
+"""
+from math import ceil
+
+import pytest
+
+from app import models
+from app.utils.refresh import refresher
+
+PATHS = ("/products", "/products/1", "/options/groups", "/categories")
+_IN_CHUNK = 500
+
+
+def _groups(products: int) -> int:
+    return max(products // 10, 2)
+
+
+def _seed_menu(db, products: int):
+    categories = [models.Category(name=f"Категория {i}") for i in range(5)]
+    groups = [
+        models.OptionGroup(
+            name=f"Группа {i}",
+            items=[models.OptionItem(name=f"Опция {i}.{j}", price=50 * j) for j in range(5)],
+        )
+        for i in range(_groups(products))
+    ]
+    db.add_all(categories + groups)
+    db.add_all(
+        models.Product(
+            name=f"Товар {i}",
+            base_price=1000 + i,
+            category=categories[i % len(categories)],
+            option_groups=[groups[i % len(groups)], groups[(i + 1) % len(groups)]],
+        )
+        for i in range(products)
+    )
+    db.commit()
+    # как после админской правки: версия каналов меню растёт, снимок устаревает
+    refresher.mark("products", "options")
+
+
+def _catalog_queries(client, count_sql) -> dict:
+    counts = {}
+    with count_sql() as sql:
+        assert client.get("/products").status_code == 200
+    counts["rebuild"] = len(sql)
+    with count_sql() as sql:
+        for path in PATHS:
+            assert client.get(path).status_code == 200
+    counts["cached"] = len(sql)
+    return counts
+
+
+@pytest.mark.parametrize("products", [10, 100, 1000])
+def test_catalog_reads_scale_with_chunks_not_rows(client, db, count_sql, products):
+    _seed_menu(db, products)
+    counts = _catalog_queries(client, count_sql)
+    # категории; товары + категория (JOIN); группы товаров; группы; опции групп
+    rebuild = 3 + ceil(products / _IN_CHUNK) + ceil(_groups(products) / _IN_CHUNK)
+    # 10 и 100 товаров -> 5 запросов, 1000 -> 6 (две пачки групп товаров)
+    assert counts == {"rebuild": rebuild, "cached": 0}
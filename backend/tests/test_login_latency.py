@@ -0,0 +1,80 @@
+# tests/test_login_latency.py
+"""
+Волна логинов (bcrypt) не останавливает event loop: остальные запросы
+и websocket-подключения воркера обслуживаются во время пересменки.
+"""
+import asyncio
+import time
+
+import httpx
+import pytest
+from passlib.hash import bcrypt
+
+from app import models
+from app.utils.security import verify_password
+
+LOGINS = 20
+PASSWORD = "secret"
+
+
+def _seed_users(db) -> str:
+    # стоимость как в проде: с 4 раундами из conftest разницы не видно
+    password_hash = bcrypt.using(rounds=12).hash(PASSWORD)
+    db.add_all(
+        models.User(name=f"Кассир {i}", phone=f"+7700000{i:04d}", password_hash=password_hash)
+        for i in range(LOGINS)
+    )
+    db.commit()
+    return password_hash
+
+
+def test_login_burst_does_not_stall_event_loop(app, client, db):
+    password_hash = _seed_users(db)
+    started = time.perf_counter()
+    verify_password(PASSWORD, password_hash)
+    hash_seconds = time.perf_counter() - started
+    if hash_seconds < 0.05:
+        pytest.skip(f"bcrypt takes {hash_seconds * 1000:.0f} ms here — too fast to show a stall")
+
+    async def burst():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            done = asyncio.Event()
+            lags, health_ms = [], []
+
+            async def probe():
+                # насколько позже обещанного просыпается корутина — задержка loop
+                while not done.is_set():
+                    t0 = time.perf_counter()
+                    await asyncio.sleep(0.005)
+                    lags.append(time.perf_counter() - t0 - 0.005)
+
+            async def health():
+                while not done.is_set():
+                    t0 = time.perf_counter()
+                    assert (await http.get("/health")).status_code == 200
+                    health_ms.append((time.perf_counter() - t0) * 1000)
+                    await asyncio.sleep(0.01)
+
+            async def logins():
+                try:
+                    responses = await asyncio.gather(*(
+                        http.post("/auth/login", json={"phone": f"+7700000{i:04d}", "password": PASSWORD})
+                        for i in range(LOGINS)
+                    ))
+                finally:
+                    done.set()
+                assert all(r.status_code == 200 for r in responses)
+
+            t0 = time.perf_counter()
+            await asyncio.gather(probe(), health(), logins())
+            return time.perf_counter() - t0, max(lags), max(health_ms)
+
+    elapsed, max_lag, health_max_ms = client.portal.call(burst)
+    timings = (
+        f"{LOGINS} logins in {elapsed:.2f}s (bcrypt {hash_seconds * 1000:.0f} ms), "
+        f"loop lag max {max_lag * 1000:.1f} ms, /health max {health_max_ms:.1f} ms"
+    )
+    # на loop каждый логин останавливал бы всё на время одного bcrypt
+    assert max_lag < hash_seconds / 2, timings
+    assert health_max_ms < hash_seconds * 1000 / 2, timings
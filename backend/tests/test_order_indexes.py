@@ -0,0 +1,79 @@
+# tests/test_order_indexes.py
+"""
+Фильтры по локальным дням (Asia/Almaty) — диапазоны [start, end) по индексам:
+на большой таблице orders в планах нет Seq Scan.
+"""
+import os
+from datetime import timedelta
+
+from sqlalchemy import func, select, text
+
+from app import models
+from app.database import engine
+from app.routers.orders import _orders_q
+from app.utils.timerange import day_range, in_range, local_today, month_range
+
+# ORDERS_EXPLAIN_ROWS=100000 — для быстрого локального прогона
+ROWS = int(os.environ.get("ORDERS_EXPLAIN_ROWS", 1_000_000))
+ACTIVE = 30
+
+_SEED = """
+INSERT INTO orders (customer_name, take_away, total, status, created_at, closed_at, guest_seq, guest_date)
+SELECT 'Гость ' || i,
+       i % 3 = 0,
+       500 + i % 2000,
+       (CASE WHEN i <= :active THEN 'active' ELSE 'closed' END)::orderstatus,
+       now() - i * interval '1 minute',
+       CASE WHEN i <= :active THEN NULL ELSE now() - i * interval '1 minute' + interval '5 minutes' END,
+       i % 500 + 1,
+       now() - i * interval '1 minute'
+FROM generate_series(1, :rows) AS i
+"""
+
+
+def _statements():
+    o = models.Order
+    today, month = day_range(), month_range()
+    yesterday = local_today() - timedelta(days=1)
+    return {
+        # close_order: дневной номер среди активных за сегодня
+        "close_order": _orders_q()
+        .filter(o.status == models.OrderStatus.active, o.guest_seq == 7, in_range(o.guest_date, today))
+        .order_by(o.created_at.desc())
+        .limit(1),
+        "orders_today": select(func.count(o.id), func.sum(o.total)).where(in_range(o.created_at, today)),
+        "orders_this_month": select(func.count(o.id)).where(in_range(o.created_at, month)),
+        "active_queue": _orders_q().filter(o.status == models.OrderStatus.active).order_by(o.created_at.asc()),
+        "recent_closed": _orders_q()
+        .filter(o.status == models.OrderStatus.closed)
+        .order_by(o.closed_at.desc())
+        .limit(10),
+        "export_closed_day": _orders_q().filter(
+            o.status == models.OrderStatus.closed,
+            o.closed_at >= day_range(yesterday)[0],
+            o.closed_at < day_range(yesterday)[1],
+        ),
+        "dashboard_recent": select(o).order_by(o.created_at.desc()).limit(5),
+    }
+
+
+def _seq_scans(plan: dict, table: str):
+    if plan.get("Node Type") == "Seq Scan" and plan.get("Relation Name") == table:
+        yield plan
+    for child in plan.get("Plans", []):
+        yield from _seq_scans(child, table)
+
+
+def test_date_bucketed_queries_use_indexes(app):
+    with engine.begin() as conn:
+        conn.execute(text(_SEED), {"rows": ROWS, "active": ACTIVE})
+        conn.execute(text("ANALYZE orders"))
+
+    offenders = {}
+    with engine.connect() as conn:
+        for name, stmt in _statements().items():
+            sql = str(stmt.compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True}))
+            plan = conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {sql}").scalar_one()[0]["Plan"]
+            if any(_seq_scans(plan, "orders")):
+                offenders[name] = plan
+    assert not offenders, offenders
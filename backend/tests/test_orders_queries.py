@@ -0,0 +1,82 @@
+# tests/test_orders_queries.py
+"""
+Чтение заказов без N+1: запросов — по одному на уровень (заказы, позиции,
+опции), а не на строку. selectinload шлёт IN-списки пачками по 500
+(SelectInLoader._chunksize), поэтому на уровень приходится ceil(строк / 500).
+"""
+from math import ceil
+
+import pytest
+
+from app import models
+from app.database import AsyncSessionLocal
+from app.routers.orders import _orders_snapshot
+
+ITEMS = 3
+_IN_CHUNK = 500
+
+
+def _seed_menu(db):
+    product = models.Product(name="Латте", base_price=1000)
+    group = models.OptionGroup(name="Сироп")
+    extras = [models.OptionItem(group=group, name=f"Сироп {i}", price=100) for i in range(2)]
+    db.add_all([product, group, *extras])
+    db.commit()
+    return product, extras
+
+
+def _add_orders(db, menu, n: int, items: int = ITEMS):
+    product, extras = menu
+    for i in range(n):
+        order = models.Order(customer_name=f"Гость {i}", take_away=False, total=0, guest_seq=i + 1)
+        for _ in range(items):
+            item = models.OrderItem(product=product, name_snapshot=product.name, unit_price=1200, qty=1)
+            for op in extras:
+                item.options.append(models.OrderItemOption(option_item=op, name_snapshot=op.name, price=op.price))
+            order.items.append(item)
+        db.add(order)
+    db.commit()
+
+
+def _select_in(orders: int) -> int:
+    """Выборка заказов + selectinload позиций и их опций."""
+    if not orders:
+        return 1
+    return 1 + ceil(orders / _IN_CHUNK) + ceil(orders * ITEMS / _IN_CHUNK)
+
+
+def _expected(active: int) -> dict:
+    # закрытых заказов нет: их выборка — один запрос без подгрузок
+    feed = _select_in(active) + _select_in(0)
+    return {
+        "/orders/feed": feed,
+        "/orders?status=active&limit=500": _select_in(min(active, 500)),
+        "snapshot": feed,
+    }
+
+
+def _read_queries(client, headers, count_sql) -> dict:
+    counts = {}
+    for path in ("/orders/feed", "/orders?status=active&limit=500"):
+        client.get(path, headers=headers)  # прогрев: кэш пользователя, соединения пула
+        with count_sql() as sql:
+            assert client.get(path, headers=headers).status_code == 200
+        counts[path] = len(sql)
+
+    async def build():
+        async with AsyncSessionLocal() as s:
+            return await _orders_snapshot(s)
+
+    # снимок канала orders — на loop приложения, там живёт async-пул
+    with count_sql() as sql:
+        client.portal.call(build)
+    counts["snapshot"] = len(sql)
+    return counts
+
+
+@pytest.mark.parametrize("n", [3, 40, 400])
+def test_order_reads_scale_with_chunks_not_rows(client, db, auth_headers, count_sql, n):
+    _add_orders(db, _seed_menu(db), n)
+    counts = _read_queries(client, auth_headers, count_sql)
+    # 3 заказа -> 4 запроса ленты, 400 (1200 позиций) -> 6; с N+1 было бы ~1600
+    assert counts == _expected(n)
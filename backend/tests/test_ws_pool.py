@@ -0,0 +1,72 @@
+# tests/test_ws_pool.py
+"""
+Websocket-подключения не держат соединения пула: сотни экранов открыты,
+а пулы sync и async свободны; снимок на всех собирается один раз.
+"""
+import asyncio
+from contextlib import ExitStack
+
+from app import models
+from app.utils.refresh import refresher
+
+SOCKETS = 100  # на каждый канал
+CHANNELS = {
+    "/products/ws": "by_category",
+    "/options/ws": "groups",
+    "/orders/ws": "active",
+    "/dashboard/ws": None,  # дашборд шлёт только обновления
+}
+
+
+def _seed(db):
+    group = models.OptionGroup(name="Сироп", items=[models.OptionItem(name="Ваниль", price=100)])
+    product = models.Product(name="Латте", base_price=1000, option_groups=[group])
+    db.add(product)
+    db.add(models.Order(customer_name="Гость", take_away=False, total=1000, guest_seq=1))
+    db.commit()
+    refresher.mark("products", "options")
+
+
+def _checked_out(client) -> dict:
+    pools = client.get("/health/db").json()
+    return {name: pool["checked_out"] for name, pool in pools.items()}
+
+
+def test_open_sockets_leave_pool_free(client, db):
+    _seed(db)
+    with ExitStack() as stack:
+        for path, key in CHANNELS.items():
+            for _ in range(SOCKETS):
+                ws = stack.enter_context(client.websocket_connect(path))
+                if key:
+                    assert key in ws.receive_json()
+        assert _checked_out(client) == {"sync": 0, "async": 0}
+        # мутация при открытых сокетах: рассылка снимков тоже не копит соединения
+        refresher.mark("products", "options", "dashboard")
+        client.portal.call(asyncio.sleep, max(refresher.window * 5, 1.0))
+        assert _checked_out(client) == {"sync": 0, "async": 0}
+    metrics = client.get("/health/ws").json()
+    assert all(ch["connections"] == 0 for ch in metrics.values())
+
+
+def test_concurrent_joins_share_one_snapshot_build(client, db, count_sql):
+    _seed(db)
+
+    async def one_build():
+        refresher._invalidate("orders")
+        await refresher.snapshot("orders")
+
+    with count_sql() as sql:
+        client.portal.call(one_build)
+    single = len(sql)
+
+    async def stampede():
+        # как сотни экранов, переподключившихся разом после рестарта
+        refresher._invalidate("orders")
+        frames = await asyncio.gather(*(refresher.snapshot("orders") for _ in range(500)))
+        assert len(set(frames)) == 1
+
+    with count_sql() as sql:
+        client.portal.call(stampede)
+    assert len(sql) == single
+    assert _checked_out(client) == {"sync": 0, "async": 0}
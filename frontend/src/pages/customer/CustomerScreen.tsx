@@ -1,26 +1,22 @@
 import { useEffect, useMemo, useRef, useState } from "react";
-import api from "../../api/client";
 import { Link } from "react-router-dom";
 
-type Order = { id:number; customer_name:string; created_at:string };
+// id — дневной номер (для показа), pk — настоящий id заказа (для дельт)
+type Order = { id:number; pk:number; customer_name:string; created_at:string };
 const READY_WINDOW_MIN = 5;
 
+const RECENT_CLOSED = 10;
+
 function useOrdersFeed() {
   const [active, setActive] = useState<Order[]>([]);
   const [closed, setClosed] = useState<Order[]>([]);
   const wsRef = useRef<WebSocket | null>(null);
-
-  async function bootstrap() {
-    const [a, c] = await Promise.all([
-      api.get("/orders?status=active"),
-      api.get("/orders?status=closed"),
-    ]);
-    setActive(a.data);
-    setClosed(c.data);
-  }
+  // последний применённый seq; null — ждём полный снимок
+  const seqRef = useRef<number | null>(null);
+  // события, пришедшие раньше снимка: после снимка применим те, что новее его seq
+  const pendingRef = useRef<any[]>([]);
 
   useEffect(() => {
-    bootstrap();
     connect();
     return () => wsRef.current?.close();
   }, []);
@@ -30,14 +26,49 @@ function useOrdersFeed() {
     const wsUrl = base.replace(/^http/, "ws") + "/orders/ws";
     const ws = new WebSocket(wsUrl);
     wsRef.current = ws;
+    seqRef.current = null;
+    pendingRef.current = [];
+
+    function applyDelta(msg: any) {
+      if (seqRef.current === null) {
+        pendingRef.current.push(msg);
+        return;
+      }
+      if (msg.seq <= seqRef.current) return;
+      if (msg.seq !== seqRef.current + 1) {
+        // пропустили событие — просим полный снимок, а пока копим события
+        seqRef.current = null;
+        pendingRef.current = [msg];
+        ws.send(JSON.stringify({ type: "resync" }));
+        return;
+      }
+      seqRef.current = msg.seq;
+      const o: Order | undefined = msg.order;
+      if (msg.type === "order_added" && o) {
+        setActive((prev) => [...prev.filter((x) => x.pk !== o.pk), o]);
+      } else if (msg.type === "order_closed" && o) {
+        setActive((prev) => prev.filter((x) => x.pk !== o.pk));
+        setClosed((prev) => [o, ...prev.filter((x) => x.pk !== o.pk)].slice(0, RECENT_CLOSED));
+      } else if (msg.type === "closed_cleared") {
+        setClosed([]);
+      }
+    }
+
     ws.onmessage = (e) => {
       try {
         const msg = JSON.parse(e.data);
         if (msg.type === "orders") {
-          if (Array.isArray(msg.active)) setActive(msg.active);
-          if (Array.isArray(msg.closed)) setClosed(msg.closed);
+          // полный снимок (при подключении и после resync)
+          setActive(msg.active ?? []);
+          setClosed(msg.recent_closed ?? []);
+          seqRef.current = msg.seq;
+          // дельты идемпотентны: отложенные события новее снимка просто доигрываем
+          const pending = pendingRef.current;
+          pendingRef.current = [];
+          pending.sort((a, b) => a.seq - b.seq).forEach(applyDelta);
+          return;
         }
-        if (msg.type === "clear_closed") setClosed([]);
+        applyDelta(msg);
       } catch {}
     };
     ws.onclose = () => setTimeout(connect, 1500);
@@ -92,7 +123,7 @@ export default function CustomerScreen() {
                 <div className="h-1 bg-slate-500 rounded mt-3 mb-6 mx-16" />
                 <div className="space-y-5">
                   {readyFiltered.map((o) => (
-                    <Row key={o.id} name={o.customer_name || "Без имени"} badge={`${o.id}`} variant="ready" />
+                    <Row key={o.pk} name={o.customer_name || "Без имени"} badge={`${o.id}`} variant="ready" />
                   ))}
                 </div>
               </section>
@@ -103,7 +134,7 @@ export default function CustomerScreen() {
                 <div className="h-1 bg-emerald-500 rounded mt-3 mb-6" />
                 <div className="space-y-5">
                   {active.map((o) => (
-                    <Row key={o.id} name={o.customer_name || "Без имени"} badge={`${o.id}`} variant="cooking" />
+                    <Row key={o.pk} name={o.customer_name || "Без имени"} badge={`${o.id}`} variant="cooking" />
                   ))}
                 </div>
               </section>